@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+# www.github.com/pl247/ai-toolkit
+
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import http.server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def load_monitor():
+    """Import ai-monitor-plus.py, whose name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location('ai_monitor_plus', os.path.join(HERE, 'ai-monitor-plus.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+def make_procfs(root, cpus, sockets, nics, gpus=0):
+    """Create a synthetic /proc and /sys tree with the given CPU and NIC counts, one NUMA node per socket."""
+    stat = [f"cpu  {cpus * 1000} 0 {cpus * 500} {cpus * 8000} 10 0 5 0 0 0"]
+    for cpu in range(cpus):
+        stat.append(f"cpu{cpu} 1000 0 500 8000 10 0 5 0 0 0")
+        topology = os.path.join(root, 'sys', 'devices', 'system', 'cpu', f'cpu{cpu}', 'topology')
+        write(os.path.join(topology, 'physical_package_id'), f"{cpu * sockets // cpus}\n")
+        write(os.path.join(topology, 'core_id'), f"{cpu % (cpus // sockets)}\n")
+    for node in range(sockets):
+        node_dir = os.path.join(root, 'sys', 'devices', 'system', 'node', f'node{node}')
+        per_node = cpus // sockets
+        write(os.path.join(node_dir, 'cpulist'), f"{node * per_node}-{(node + 1) * per_node - 1}\n")
+        write(os.path.join(node_dir, 'meminfo'), f"Node {node} MemTotal: {1056000000 // sockets} kB\n"
+                                                 f"Node {node} MemFree: {52000000 // sockets} kB\n"
+                                                 f"Node {node} MemUsed: {1004000000 // sockets} kB\n")
+        write(os.path.join(node_dir, 'numastat'), "numa_hit 1000000\nnuma_miss 0\nnuma_foreign 0\n"
+                                                  "interleave_hit 0\nlocal_node 990000\nother_node 10000\n")
+    for gpu in range(gpus):  # bus IDs as emitted by the nvidia-smi shim
+        write(os.path.join(root, 'sys', 'bus', 'pci', 'devices', f"0000:{gpu + 0x18:02x}:00.0", 'numa_node'),
+              f"{gpu * sockets // gpus}\n")
+    stat.append("intr 0")
+    write(os.path.join(root, 'proc', 'stat'), '\n'.join(stat) + '\n')
+    write(os.path.join(root, 'proc', 'meminfo'),
+          "MemTotal:       1056000000 kB\nMemFree:         52000000 kB\nMemAvailable:   900000000 kB\n")
+    write(os.path.join(root, 'proc', 'cpuinfo'), "model name\t: Benchmark CPU @ 3.00GHz\n")
+    write(os.path.join(root, 'sys', 'devices', 'virtual', 'dmi', 'id', 'product_name'), "BENCH-NODE\n")
+
+    dev = ["Inter-|   Receive                                                |  Transmit",
+           " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed"]
+    names = ['lo', 'eth0'] + [f"veth{i:04x}" for i in range(max(nics - 2, 0))]
+    for name in names[:nics]:
+        dev.append(f"{name:>6}: 123456789 1000 0 0 0 0 0 0 987654321 1000 0 0 0 0 0 0")
+        net = os.path.join(root, 'sys', 'class', 'net', name)
+        write(os.path.join(net, 'operstate'), "up\n")
+        write(os.path.join(net, 'statistics', 'rx_bytes'), "123456789\n")
+        write(os.path.join(net, 'statistics', 'tx_bytes'), "987654321\n")
+        if name == 'eth0':
+            write(os.path.join(net, 'device', 'numa_node'), "0\n")
+    write(os.path.join(root, 'proc', 'net', 'dev'), '\n'.join(dev) + '\n')
+
+def make_cgroupfs(root, containers):
+    """Create a synthetic cgroup v2 tree with Docker containers in system.slice and Kubernetes pods in kubepods.slice.
+
+    Every container gets a process with its own /proc/PID/ns/net and net/dev,
+    except the last one, whose namespace cannot be read.
+    """
+    cgroup = os.path.join(root, 'sys', 'fs', 'cgroup')
+    write(os.path.join(root, 'proc', 'self', 'ns', 'net'), "")
+
+    def group(relative, usage, memory, pid=None):
+        path = os.path.join(cgroup, relative)
+        write(os.path.join(path, 'cpu.stat'), f"usage_usec {usage}\nuser_usec {usage}\nsystem_usec 0\n"
+                                               f"nr_periods 1000\nnr_throttled 10\nthrottled_usec 5000\n")
+        write(os.path.join(path, 'cpu.max'), "200000 100000\n" if pid else "max 100000\n")
+        write(os.path.join(path, 'memory.current'), f"{memory}\n")
+        write(os.path.join(path, 'memory.max'), f"{memory * 2}\n" if pid else "max\n")
+        write(os.path.join(path, 'memory.stat'), f"anon {memory // 2}\nfile {memory // 2}\n")
+        write(os.path.join(path, 'io.stat'), "8:0 rbytes=1048576 wbytes=2097152 rios=10 wios=20\n")
+        write(os.path.join(path, 'cgroup.procs'), f"{pid}\n" if pid else "")
+
+    pods = containers // 2
+    for slice_name, members in (('system.slice', containers - pods), ('kubepods.slice', pods), ('user.slice', 0)):
+        group(slice_name, 1000000 * (members + 1), 2 ** 30 * (members + 1))
+    for n in range(containers):
+        pid = 10000 + n
+        container_id = f"{n + 1:012x}{0xabcdef:052x}"
+        if n < containers - pods:
+            relative = os.path.join('system.slice', f"docker-{container_id}.scope")
+        else:
+            pod = os.path.join('kubepods.slice', 'kubepods-burstable.slice', f"kubepods-burstable-pod{n:08x}_0000.slice")
+            relative = os.path.join(pod, f"cri-containerd-{container_id}.scope")
+        group(relative, 1000000, 2 ** 30, pid)
+        if n != containers - 1:
+            write(os.path.join(root, 'proc', str(pid), 'ns', 'net'), "")
+        write(os.path.join(root, 'proc', str(pid), 'net', 'dev'),
+              "Inter-|   Receive\n face |bytes\n    lo: 100 1 0 0 0 0 0 0 100 1 0 0 0 0 0 0\n"
+              "  eth0: 123456 100 0 0 0 0 0 0 654321 100 0 0 0 0 0 0\n")
+
+NVIDIA_SMI_SHIM = '''#!{python}
+# nvidia-smi stand-in: emits {gpus} GPUs for whatever --query-gpu fields are asked for,
+# and one compute process per GPU (the caller) for --query-compute-apps
+import os, sys, time
+fields, period = [], None
+for arg in sys.argv[1:]:
+    if arg.startswith('--query-gpu='):
+        fields = arg.split('=', 1)[1].split(',')
+    elif arg.startswith('--query-compute-apps='):
+        for gpu in range({gpus}):
+            app = {{'gpu_uuid': f"GPU-{{gpu:08d}}", 'pid': str(os.getppid()), 'used_memory': str(1024 * (gpu + 1))}}
+            print(', '.join(app.get(field, '[N/A]') for field in arg.split('=', 1)[1].split(',')))
+        sys.exit(0)
+    elif arg.startswith('-lms='):
+        period = int(arg.split('=', 1)[1]) / 1000
+tick = 0
+while True:
+    for gpu in range({gpus}):
+        values = []
+        for field in fields:
+            if field == 'index':
+                values.append(str(gpu))
+            elif field == 'uuid':
+                values.append(f"GPU-{{gpu:08d}}")
+            elif field in ('name', 'gpu_name'):
+                values.append("NVIDIA H100 80GB HBM3")
+            elif field == 'pci.bus_id':
+                values.append(f"00000000:{{gpu + 0x18:02X}}:00.0")
+            elif field == 'clocks_throttle_reasons.active':
+                values.append("0x0000000000000000")
+            else:
+                values.append(str((gpu * 7 + tick) % 100))
+        print(', '.join(values), flush=True)
+    tick += 1
+    if period is None:
+        break
+    time.sleep(period)
+'''
+
+def make_nvidia_smi(bindir, gpus):
+    path = os.path.join(bindir, 'nvidia-smi')
+    write(path, NVIDIA_SMI_SHIM.format(python=sys.executable, gpus=gpus))
+    os.chmod(path, 0o755)
+
+def vllm_exposition(models, buckets=20, generated=0, running=0):
+    """Return a vLLM-like /metrics body with counters, gauges and histograms per model.
+
+    generated and running are added to the first model's generation
+    counter and running gauge, so the stub's completions show up in it.
+    """
+    lines = []
+    for family, metric_type in (('vllm:num_requests_running', 'gauge'), ('vllm:num_requests_waiting', 'gauge'),
+                                ('vllm:gpu_cache_usage_perc', 'gauge'), ('vllm:prompt_tokens_total', 'counter'),
+                                ('vllm:generation_tokens_total', 'counter')):
+        lines.append(f"# HELP {family} {family}")
+        lines.append(f"# TYPE {family} {metric_type}")
+        for model in range(models):
+            value = 1000.0 * (model + 1)
+            if model == 0 and family == 'vllm:generation_tokens_total':
+                value += generated
+            elif model == 0 and family == 'vllm:num_requests_running':
+                value = running
+            lines.append(f'{family}{{model_name="model-{model}"}} {value}')
+    for family in ('vllm:time_to_first_token_seconds', 'vllm:time_per_output_token_seconds',
+                   'vllm:e2e_request_latency_seconds'):
+        lines.append(f"# HELP {family} {family}")
+        lines.append(f"# TYPE {family} histogram")
+        for model in range(models):
+            for bucket in range(buckets):
+                lines.append(f'{family}_bucket{{le="{0.001 * 2 ** bucket}",model_name="model-{model}"}} {bucket * 10.0}')
+            lines.append(f'{family}_bucket{{le="+Inf",model_name="model-{model}"}} {buckets * 10.0}')
+            lines.append(f'{family}_sum{{model_name="model-{model}"}} 123.4')
+            lines.append(f'{family}_count{{model_name="model-{model}"}} {buckets * 10.0}')
+    return '\n'.join(lines) + '\n'
+
+class StubVllmHandler(http.server.BaseHTTPRequestHandler):
+    """vLLM stand-in: /metrics, /v1/models and streaming /v1/completions.
+
+    Completions stream max_tokens chunks; the delay between tokens grows
+    with the number of requests running so throughput saturates the way a
+    real server's does.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        if self.path.startswith('/v1/models'):
+            models = [{'id': f"model-{model}", 'object': 'model'} for model in range(max(server.models, 1))]
+            self.send_body(json.dumps({'object': 'list', 'data': models}).encode(), 'application/json')
+            return
+        time.sleep(server.latency)
+        with server.lock:
+            if server.body is None:
+                server.body = vllm_exposition(server.models, generated=server.generated,
+                                              running=server.running).encode()
+            body = server.body
+        self.send_body(body, 'text/plain; version=0.0.4')
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path == '/alerts':  # stand-in for an alert webhook receiver
+            print(json.dumps(request), flush=True)
+            self.send_response(204)
+            self.end_headers()
+            return
+        max_tokens = int(request.get('max_tokens') or 16)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send(message):
+            data = f"data: {message}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+        with server.lock:
+            server.running += 1
+        try:
+            for token in range(max_tokens):
+                time.sleep(server.token_delay * (1 + server.running / server.saturation))
+                send(json.dumps({'object': 'text_completion', 'model': request.get('model'),
+                                 'choices': [{'index': 0, 'text': f" tok{token}", 'finish_reason': None}]}))
+                with server.lock:
+                    server.generated += 1
+                    server.body = None
+            send(json.dumps({'object': 'text_completion', 'choices': [],
+                             'usage': {'prompt_tokens': 8, 'completion_tokens': max_tokens}}))
+            send('[DONE]')
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client cancelled the request
+        finally:
+            with server.lock:
+                server.running -= 1
+                server.body = None
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_vllm(models, latency, address=('127.0.0.1', 0), token_delay=0.01, saturation=16):
+    server = http.server.ThreadingHTTPServer(address, StubVllmHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.models = models
+    server.generated = server.running = 0
+    server.body = vllm_exposition(models).encode()
+    server.latency = latency
+    server.token_delay = token_delay
+    server.saturation = saturation
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_scenario(monitor, scenario, ticks, interval, workdir):
+    """Run the monitor's collectors for ticks ticks in a fresh fake environment."""
+    root = tempfile.mkdtemp(dir=workdir)
+    bindir = os.path.join(root, 'bin')
+    make_procfs(root, scenario['cpus'], scenario['sockets'], scenario['nics'], scenario['gpus'])
+    if scenario['cgroups']:
+        make_cgroupfs(root, scenario['cgroups'])
+    make_nvidia_smi(bindir, scenario['gpus'])
+    os.environ['PATH'] = bindir + os.pathsep + os.environ['PATH']
+
+    server = start_stub_vllm(scenario['models'], scenario['latency']) if scenario['models'] else None
+    args = argparse.Namespace(
+        api_url=[f"http://127.0.0.1:{server.server_port}/metrics"] if server else [], api_targets=None, api_timeout=1.0,
+        latency_window=60, slo=[],
+        interval=interval, root=root, gpu_backend='nvidia-smi', smoothing='ewma', smoothing_window=5,
+        nic_include=[], nic_exclude=[], sample_rate=[], processes=0, cgroups=scenario['cgroups'])
+    setup_start = time.monotonic()
+    scheduler = monitor.Scheduler(monitor.build_collectors(args, monitor.ProcSampler(root)), interval)
+    try:
+        starts = []
+        cpu_before = time.process_time()
+        wall_before = time.monotonic()
+        for _, snapshot in zip(range(ticks), scheduler.run()):
+            starts.append(time.monotonic())
+        cpu_time = time.process_time() - cpu_before
+        wall_time = time.monotonic() - wall_before
+        stats = scheduler.stats.summary()
+    finally:
+        scheduler.close()
+        os.environ['PATH'] = os.environ['PATH'].split(os.pathsep, 1)[1]
+        if server:
+            server.shutdown()
+
+    periods = [after - before for before, after in zip(starts, starts[1:])]
+    return dict(scenario, **{
+        'ticks': ticks,
+        'interval': interval,
+        'first_tick_ms': (starts[0] - setup_start) * 1e3,
+        'tick_p50_ms': stats['latency']['tick']['p50'] * 1e3,
+        'tick_p99_ms': stats['latency']['tick']['p99'] * 1e3,
+        'tick_max_ms': stats['latency']['tick']['max'] * 1e3,
+        'cpu_ms_per_tick': cpu_time / ticks * 1e3,
+        'cpu_percent': 100 * cpu_time / wall_time,
+        'jitter_ms': statistics.pstdev(periods) * 1e3 if periods else 0.0,
+        'max_period_error_ms': max(abs(period - interval) for period in periods) * 1e3 if periods else 0.0,
+        'overruns': stats['overruns'],
+        'stale': snapshot['stale'],
+        'cgroups_seen': len(snapshot.get('cgroup') or []),
+        'rss_bytes': stats['rss'],
+        'collectors_p99_ms': {phase: latency['p99'] * 1e3 for phase, latency in stats['latency'].items()
+                              if latency['count'] and phase != 'tick'},
+    })
+
+def fake_series(agent, tick):
+    """Series an agent on a 1-GPU node would send, varying per agent and tick."""
+    value = float((agent * 7 + tick) % 100)
+    return {'cpu': value, 'gpu0.utilization': value, 'gpu0.memory_used': value / 10,
+            'nic.eth0.tx': value * 1e6, 'nic.eth0.rx': value * 2e6}
+
+def run_cluster(monitor, agents, ticks, interval):
+    """Run an aggregator and agents with fake collectors on localhost.
+
+    Half-way through, one agent disconnects and reconnects, and another is
+    replaced by a new connection under the same name before its old one
+    closes. Returns the checks made on the aggregator's host table.
+    """
+    import asyncio
+    aggregator = monitor.Aggregator(stale_after=3 * interval)
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(aggregator.handle, '127.0.0.1', 0))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    address = server.sockets[0].getsockname()[:2]
+
+    async def host_table():
+        return {name: (status, summary) for name, status, summary in aggregator.rows()}
+
+    def rows():
+        time.sleep(min(interval, 0.1))  # let the aggregator read what was sent
+        return asyncio.run_coroutine_threadsafe(host_table(), loop).result()
+
+    connections = [monitor.AgentConnection(address, f"node{agent:03d}", retry=0) for agent in range(agents)]
+    checks = []
+    tick = 0
+
+    def run(count):
+        nonlocal tick
+        for _ in range(count):
+            for agent, connection in enumerate(connections):
+                connection.send(time.time(), fake_series(agent, tick))
+            tick += 1
+            time.sleep(interval)
+
+    def check(name, passed):
+        checks.append({'check': name, 'passed': bool(passed)})
+
+    start = time.monotonic()
+    try:
+        run(max(ticks // 2, 1))
+        table = rows()
+        check('all agents up', len(table) == agents and all(status == 'ok' for status, _ in table.values()))
+
+        connections[0].close()
+        check('disconnected agent shows down', rows()['node000'][0] == 'down')
+        run(1)
+        check('reconnected agent shows up', rows()['node000'][0] == 'ok')
+
+        if agents > 1:
+            old, connections[1] = connections[1], monitor.AgentConnection(address, 'node001', retry=0)
+            run(1)
+            old.close()
+            table = rows()
+            check('takeover survives the old connection closing', table['node001'][0] == 'ok')
+            check('takeover shows the new series', table['node001'][1]['cpu'] == fake_series(1, tick - 1)['cpu'])
+        run(max(ticks - ticks // 2 - 2, 1))
+        check('all agents up at the end', all(status == 'ok' for status, _ in rows().values()))
+    finally:
+        for connection in connections:
+            connection.close()
+        loop.call_soon_threadsafe(server.close)
+        loop.call_soon_threadsafe(loop.stop)
+    return {'agents': agents, 'ticks': tick, 'interval': interval,
+            'seconds': time.monotonic() - start, 'checks': checks}
+
+def run_replay(monitor, ticks, interval, workdir, gap_every=5):
+    """Record ticks from the collectors with the CPU and memory readings missing every gap_every-th tick, then replay.
+
+    Checks that replayed snapshots carry the same top-level keys as live
+    ones, including the process and cgroup views, and that the TUI plays
+    the recording to its end in a pseudo terminal and exits cleanly on q.
+    """
+    import fcntl
+    import pty
+    import select
+    import struct
+    import termios
+    root = tempfile.mkdtemp(dir=workdir)
+    bindir = os.path.join(root, 'bin')
+    make_procfs(root, 8, 2, 4, 2)
+    make_cgroupfs(root, 4)
+    make_nvidia_smi(bindir, 2)
+    os.environ['PATH'] = bindir + os.pathsep + os.environ['PATH']
+    path = os.path.join(root, 'session.rec')
+    args = argparse.Namespace(
+        api_url=[], api_targets=None, api_timeout=1.0, latency_window=60, slo=[],
+        interval=interval, root=root, gpu_backend='nvidia-smi', smoothing='ewma', smoothing_window=5,
+        nic_include=[], nic_exclude=[], sample_rate=[], processes=3, cgroups=4)
+    sampler = monitor.ProcSampler(root)
+    recorder = monitor.Recorder(path, monitor.Inventory(sampler, root).node_info(), interval)
+    scheduler = monitor.Scheduler(monitor.build_collectors(args, sampler), interval)
+    try:
+        for n, snapshot in zip(range(ticks), scheduler.run()):
+            if n % gap_every == gap_every - 1:
+                snapshot = dict(snapshot, cpu=None, memory=None)  # as when those collectors fail
+            recorder.append(snapshot)
+    finally:
+        scheduler.close()
+        recorder.close()
+        os.environ['PATH'] = os.environ['PATH'].split(os.pathsep, 1)[1]
+
+    checks = []
+    replay = monitor.Replay(path)
+    snapshots = [replay.snapshot(n) for n in range(len(replay))]
+    replay.close()
+    checks.append({'check': 'replayed snapshots have the live top-level keys',
+                   'passed': all({'cpu', 'memory', 'gpu', 'nic'} <= snapshot.keys() for snapshot in snapshots)})
+    checks.append({'check': 'process and cgroup views are recorded and replayed',
+                   'passed': all(snapshot.get('process') and snapshot.get('cgroup') for snapshot in snapshots[1:])})
+    checks.append({'check': 'gaps are replayed as missing readings',
+                   'passed': sum(snapshot.get('cpu') is None for snapshot in snapshots) == ticks // gap_every})
+
+    pid, fd = pty.fork()
+    if pid == 0:
+        fcntl.ioctl(0, termios.TIOCSWINSZ, struct.pack('HHHH', 40, 120, 0, 0))
+        os.environ['TERM'] = 'xterm'
+        os.execv(sys.executable, [sys.executable, os.path.join(HERE, 'ai-monitor-plus.py'),
+                                  '--replay', path, '--speed', '100'])
+    screen = b''
+    deadline = time.monotonic() + 10 + ticks * interval / 100
+    while b'end of recording' not in screen and time.monotonic() < deadline:
+        if select.select([fd], [], [], 0.1)[0]:
+            try:
+                data = os.read(fd, 65536)
+            except OSError:
+                break  # the TUI exited
+            if not data:
+                break
+            screen += data
+    try:
+        os.write(fd, b'q')
+    except OSError:
+        pass
+    for _ in range(50):
+        finished, status = os.waitpid(pid, os.WNOHANG)
+        if finished:
+            break
+        time.sleep(0.1)
+    else:
+        os.kill(pid, 9)
+        finished, status = os.waitpid(pid, 0)
+    os.close(fd)
+    checks.append({'check': 'TUI replays to the end of the recording', 'passed': b'end of recording' in screen})
+    checks.append({'check': 'TUI exits cleanly', 'passed': os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0})
+    return {'ticks': ticks, 'gap_every': gap_every, 'records': len(snapshots), 'checks': checks}
+
+def int_list(text):
+    return [int(value) for value in text.split(',')]
+
+def float_list(text):
+    return [float(value) for value in text.split(',')]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark ai-monitor-plus.py collection against local stand-ins")
+    parser.add_argument('--gpus', type=int_list, default=[1, 8], help='GPU counts to emit from the nvidia-smi shim')
+    parser.add_argument('--nics', type=int_list, default=[4, 500], help='Interface counts in the fake /proc/net/dev')
+    parser.add_argument('--cpus', type=int_list, default=[64], help='CPU counts in the fake /proc/stat')
+    parser.add_argument('--sockets', type=int, default=2, help='Sockets the fake CPUs are spread over')
+    parser.add_argument('--cgroups', type=int_list, default=[0],
+                        help='Containers in the fake cgroup v2 tree (0 disables the cgroup collector)')
+    parser.add_argument('--models', type=int_list, default=[1], help='Models in the stub vLLM exposition (0 disables it)')
+    parser.add_argument('--latency', type=float_list, default=[0, 0.5], help='Stub vLLM response delays in seconds')
+    parser.add_argument('--ticks', type=int, default=10, help='Ticks to run per scenario')
+    parser.add_argument('--interval', type=float, default=0.25, help='Tick interval in seconds')
+    parser.add_argument('--output', type=str, default=None, help='Write the JSON report here instead of stdout')
+    parser.add_argument('--stub-server', type=str, default=None, metavar='[HOST]:PORT',
+                        help='Only run the stub vLLM server (for --loadtest and --api-url) until interrupted')
+    parser.add_argument('--agents', type=int, default=0, metavar='N',
+                        help='Only run N agents with fake collectors against a localhost aggregator, '
+                             'including a disconnect and a reconnect')
+    parser.add_argument('--replay', action='store_true',
+                        help='Only record --ticks ticks with some CPU and memory readings missing, '
+                             'then replay them through the TUI')
+    parser.add_argument('--token-delay', type=float, default=0.01,
+                        help='Seconds between streamed tokens of the stub server when idle')
+    args = parser.parse_args()
+
+    if args.stub_server:
+        host, _, port = args.stub_server.rpartition(':')
+        server = start_stub_vllm(args.models[0], args.latency[0], (host or '127.0.0.1', int(port)), args.token_delay)
+        print(f"Stub vLLM server on http://{host or '127.0.0.1'}:{port} (/metrics, /v1/models, /v1/completions)",
+              file=sys.stderr)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            sys.exit(0)
+
+    monitor = load_monitor()
+    if args.agents or args.replay:
+        if args.agents:
+            result = run_cluster(monitor, args.agents, args.ticks, args.interval)
+        else:
+            with tempfile.TemporaryDirectory(prefix='ai-monitor-bench-') as workdir:
+                result = run_replay(monitor, args.ticks, args.interval, workdir)
+        for check in result['checks']:
+            print(f"{'ok  ' if check['passed'] else 'FAIL'} {check['check']}", file=sys.stderr)
+        print(json.dumps(result, indent=2))
+        sys.exit(0 if all(check['passed'] for check in result['checks']) else 1)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='ai-monitor-bench-') as workdir:
+        for gpus, nics, cpus, models, latency, cgroups in itertools.product(args.gpus, args.nics, args.cpus,
+                                                                            args.models, args.latency, args.cgroups):
+            scenario = {'gpus': gpus, 'nics': nics, 'cpus': cpus, 'sockets': args.sockets,
+                        'models': models, 'latency': latency, 'cgroups': cgroups}
+            result = run_scenario(monitor, scenario, args.ticks, args.interval, workdir)
+            results.append(result)
+            print(f"gpus={gpus:<3} nics={nics:<4} cpus={cpus:<4} models={models:<3} latency={latency:<5} "
+                  f"cgroups={cgroups:<4} "
+                  f"tick p50={result['tick_p50_ms']:7.2f}ms p99={result['tick_p99_ms']:7.2f}ms "
+                  f"cpu={result['cpu_ms_per_tick']:6.2f}ms/tick jitter={result['jitter_ms']:6.2f}ms "
+                  f"rss={result['rss_bytes'] / 2 ** 20:.1f}MiB", file=sys.stderr)
+
+    report = json.dumps({'python': sys.version.split()[0], 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
@@ -1,15 +1,33 @@
 #!/usr/bin/env python3
 # www.github.com/pl247/ai-toolkit
 
-import subprocess
 import time
+START_TIME = time.perf_counter()  # the startup budget is measured from here
+STARTUP_BUDGET = 0.1  # seconds from START_TIME to the first drawn screen
+import subprocess
+import os
 import sys
+import csv
+import math
+import threading
+import collections
+import array
+import locale
+import json
+import struct
 import psutil
 import curses
 import socket
-import requests
 import re
+import hashlib
+import fnmatch
+import itertools
 import argparse  # Import the argparse module
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait
+
+SPARK_TICKS = '\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588'
+ASCII_SPARK_TICKS = '_.-=+*#@'
 
 def convert_bps(bits_per_second):
     """Convert bits per second to Mbps or Gbps based on magnitude."""
@@ -20,116 +38,3712 @@ def convert_bps(bits_per_second):
     else:
         return f"{bits_per_second / 1e9:.2f} Gbps"
 
-def poll(interval):
-    """Retrieve raw stats within an interval window."""
-    tot_before = psutil.net_io_counters()
-    pnic_before = psutil.net_io_counters(pernic=True)
-    time.sleep(interval)
-    tot_after = psutil.net_io_counters()
-    pnic_after = psutil.net_io_counters(pernic=True)
-    return (tot_before, tot_after, pnic_before, pnic_after)
+def format_bytes(n):
+    """Format a byte count the way `free -h` does (e.g. 6.2Gi, 1.5Ti)."""
+    for unit in ('B', 'Ki', 'Mi', 'Gi', 'Ti', 'Pi'):
+        if n < 1024 or unit == 'Pi':
+            break
+        n /= 1024
+    if unit == 'B':
+        return f"{int(n)}B"
+    return f"{n:.1f}{unit}" if n < 10 else f"{n:.0f}{unit}"
+
+def read_file(path):
+    with open(path) as f:
+        return f.read().strip()
+
+def parse_cpulist(text):
+    """Expand a sysfs CPU list such as 0-3,8,10-11 into a list of CPU numbers."""
+    cpus = []
+    for part in text.split(','):
+        if part.strip():
+            first, _, last = part.partition('-')
+            cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+class ProcSampler:
+    """Read CPU and memory statistics directly from /proc and /sys.
+
+    CPU utilization is computed from jiffy deltas between two consecutive
+    calls to cpu_usage(), so sampling never blocks. All paths are resolved
+    under root so the sampler can run against a fake procfs/sysfs tree.
+    """
+
+    def __init__(self, root='/'):
+        self.root = root
+        self.prev = None
+        self._topology = None
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def read_stat(self):
+        """Return {cpu_label: (busy_jiffies, total_jiffies)} from /proc/stat."""
+        times = {}
+        with open(self.path('proc', 'stat')) as f:
+            for line in f:
+                if not line.startswith('cpu'):
+                    break
+                fields = line.split()
+                values = [int(v) for v in fields[1:]]
+                # guest and guest_nice are already accounted in user and nice
+                total = sum(values[:8])
+                idle = values[3] + (values[4] if len(values) > 4 else 0)
+                times[fields[0]] = (total - idle, total)
+        return times
+
+    def cpu_usage(self):
+        """Return average, per-core, per-socket and per-NUMA-node utilization since the last call."""
+        current = self.read_stat()
+        prev, self.prev = self.prev, current
+        if prev is None:
+            # First call: report utilization since boot
+            prev = {label: (0, 0) for label in current}
+
+        def percent(busy, total):
+            return 100.0 * busy / total if total > 0 else 0.0
+
+        topology = self.topology()
+        core_socket, core_node = topology['core_socket'], topology['core_node']
+        average = 0.0
+        cores = {}
+        socket_deltas = {}
+        node_deltas = {}
+        for label, (busy, total) in current.items():
+            busy_before, total_before = prev.get(label, (0, 0))
+            busy, total = busy - busy_before, total - total_before
+            if label == 'cpu':
+                average = percent(busy, total)
+                continue
+            core = int(label[3:])
+            cores[core] = percent(busy, total)
+            socket_id = core_socket.get(core, 0)
+            busy_sum, total_sum = socket_deltas.get(socket_id, (0, 0))
+            socket_deltas[socket_id] = (busy_sum + busy, total_sum + total)
+            if core in core_node:
+                busy_sum, total_sum = node_deltas.get(core_node[core], (0, 0))
+                node_deltas[core_node[core]] = (busy_sum + busy, total_sum + total)
+
+        return {
+            'average': average,
+            'cores': cores,
+            'sockets': {sid: percent(*delta) for sid, delta in sorted(socket_deltas.items())},
+            'nodes': {node: percent(*delta) for node, delta in sorted(node_deltas.items())},
+        }
+
+    def memory(self):
+        """Return total, used and available memory in bytes from /proc/meminfo."""
+        meminfo = {}
+        with open(self.path('proc', 'meminfo')) as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                meminfo[key] = int(value.split()[0]) * 1024
+        total = meminfo.get('MemTotal', 0)
+        available = meminfo.get('MemAvailable', meminfo.get('MemFree', 0))
+        return {'total': total, 'used': total - available, 'available': available}
+
+    def topology(self):
+        """Return CPU model, socket count, cores per socket and core-to-socket and core-to-NUMA-node maps."""
+        if self._topology is not None:
+            return self._topology
+
+        model = 'Unknown'
+        try:
+            with open(self.path('proc', 'cpuinfo')) as f:
+                for line in f:
+                    if line.startswith('model name'):
+                        model = line.split(':', 1)[1].strip()
+                        break
+        except OSError:
+            pass
+
+        core_socket = {}
+        physical_cores = set()
+        cpu_dir = self.path('sys', 'devices', 'system', 'cpu')
+        try:
+            entries = os.listdir(cpu_dir)
+        except OSError:
+            entries = []
+        for entry in entries:
+            if not (entry.startswith('cpu') and entry[3:].isdigit()):
+                continue
+            topology_dir = os.path.join(cpu_dir, entry, 'topology')
+            try:
+                socket_id = int(read_file(os.path.join(topology_dir, 'physical_package_id')))
+                core_id = int(read_file(os.path.join(topology_dir, 'core_id')))
+            except (OSError, ValueError):
+                continue  # offline CPU
+            core_socket[int(entry[3:])] = socket_id
+            physical_cores.add((socket_id, core_id))
+
+        core_node = {}
+        node_dir = self.path('sys', 'devices', 'system', 'node')
+        try:
+            entries = os.listdir(node_dir)
+        except OSError:
+            entries = []  # kernel without NUMA support
+        for entry in entries:
+            if not (entry.startswith('node') and entry[4:].isdigit()):
+                continue
+            try:
+                cpus = parse_cpulist(read_file(os.path.join(node_dir, entry, 'cpulist')))
+            except (OSError, ValueError):
+                continue
+            for cpu in cpus:
+                core_node[cpu] = int(entry[4:])
+
+        sockets = len(set(core_socket.values())) or 1
+        self._topology = {
+            'model': model,
+            'sockets': sockets,
+            'cores_per_socket': len(physical_cores) // sockets,
+            'core_socket': core_socket,
+            'core_node': core_node,
+        }
+        return self._topology
+
+def get_server_type(root='/'):
+    try:
+        return read_file(os.path.join(root, 'sys/devices/virtual/dmi/id/product_name'))
+    except OSError:
+        return 'Unknown'
+
+GPU_QUERY_FIELDS = ('index', 'uuid', 'name', 'pci.bus_id', 'utilization.gpu', 'memory.used', 'memory.total',
+                    'power.draw', 'power.limit', 'clocks.sm', 'clocks.mem', 'temperature.gpu',
+                    'clocks_throttle_reasons.active')
+
+# Bits of nvidia-smi clocks_throttle_reasons.active / nvmlDeviceGetCurrentClocksThrottleReasons()
+THROTTLE_REASONS = (
+    (0x2, 'app clocks'),
+    (0x4, 'power cap'),
+    (0x8, 'hw slowdown'),
+    (0x10, 'sync boost'),
+    (0x20, 'sw thermal'),
+    (0x40, 'hw thermal'),
+    (0x80, 'power brake'),
+)
+
+def throttle_reasons(mask):
+    """Return the names of the active throttle reasons in a bitmask, ignoring GPU idle."""
+    if not mask:
+        return []
+    return [name for bit, name in THROTTLE_REASONS if mask & bit]
+
+def parse_gpu_value(value):
+    """Convert an nvidia-smi CSV field to float, or None for [N/A] style fields."""
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+class GpuBackend:
+    """Base class for a source of per-GPU records.
+
+    read() returns a list of dicts sorted by GPU index with the keys index,
+    uuid, name, pci_bus_id, utilization (%), memory_used and memory_total (GiB), power
+    and power_limit (W), sm_clock and memory_clock (MHz), temperature (C),
+    throttle (bitmask of THROTTLE_REASONS) and energy (total J since driver
+    load). Any numeric value may be None when the driver reports it as not
+    available. processes() lists the compute processes as dicts with the
+    keys uuid (of the GPU), pid and memory (GiB).
+    """
+
+    def start(self):
+        pass
+
+    def read(self):
+        raise NotImplementedError
+
+    def processes(self):
+        return []
+
+    def close(self):
+        pass
+
+class NvidiaSmiBackend(GpuBackend):
+    """Keep one `nvidia-smi -lms` process running and parse its CSV stream.
+
+    nvidia-smi prints one block of lines per period, in GPU index order.
+    Records are updated as each line arrives and GPUs missing from the
+    last complete block are dropped, so GPUs appearing or disappearing are
+    picked up without restarting the process. If nvidia-smi exits it is
+    restarted on the next read(), at most once per restart_delay seconds.
+    The compute process list needs a one-shot query, so once processes() is
+    first called it is refreshed every apps_interval seconds on a background
+    thread and processes() returns the latest list.
+    """
+
+    def __init__(self, interval=1, command='nvidia-smi', restart_delay=5, apps_interval=5):
+        self.interval_ms = max(int(interval * 1000), 50)
+        self.command = command
+        self.restart_delay = restart_delay
+        self.apps_interval = apps_interval
+        self.process = None
+        self.reader = None
+        self.started = None
+        self.gpus = {}
+        self.apps = None
+        self.apps_reader = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.started = time.monotonic()
+        try:
+            self.process = subprocess.Popen(
+                [self.command, f"--query-gpu={','.join(GPU_QUERY_FIELDS)}",
+                 '--format=csv,noheader,nounits', f'-lms={self.interval_ms}'],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        except OSError:
+            self.process = None  # nvidia-smi not installed
+            return
+        self.reader = threading.Thread(target=self._read_stream, args=(self.process.stdout,),
+                                       name='nvidia-smi-reader', daemon=True)
+        self.reader.start()
+
+    def _read_stream(self, stream):
+        last_index = None
+        seen = set()
+        for row in csv.reader(stream, skipinitialspace=True):
+            if len(row) != len(GPU_QUERY_FIELDS):
+                continue  # error message or partial line
+            fields = dict(zip(GPU_QUERY_FIELDS, row))
+            try:
+                index = int(fields['index'])
+            except ValueError:
+                continue
+            memory_used = parse_gpu_value(fields['memory.used'])
+            memory_total = parse_gpu_value(fields['memory.total'])
+            try:
+                throttle = int(fields['clocks_throttle_reasons.active'], 16)
+            except ValueError:
+                throttle = None
+            record = {
+                'index': index,
+                'uuid': fields['uuid'],
+                'name': fields['name'],
+                'pci_bus_id': fields['pci.bus_id'],
+                'utilization': parse_gpu_value(fields['utilization.gpu']),
+                'memory_used': memory_used / 1024 if memory_used is not None else None,
+                'memory_total': memory_total / 1024 if memory_total is not None else None,
+                'power': parse_gpu_value(fields['power.draw']),
+                'power_limit': parse_gpu_value(fields['power.limit']),
+                'sm_clock': parse_gpu_value(fields['clocks.sm']),
+                'memory_clock': parse_gpu_value(fields['clocks.mem']),
+                'temperature': parse_gpu_value(fields['temperature.gpu']),
+                'throttle': throttle,
+                'energy': None,
+            }
+            with self.lock:
+                if last_index is not None and index <= last_index:
+                    # GPUs are listed in index order, so a new block has started:
+                    # forget GPUs the previous block did not report
+                    self.gpus = {i: r for i, r in self.gpus.items() if i in seen}
+                    seen = set()
+                last_index = index
+                seen.add(index)
+                self.gpus[index] = record
+        with self.lock:
+            self.gpus = {}
+
+    def read(self):
+        if self.process is not None and self.process.poll() is not None:
+            if time.monotonic() - self.started >= self.restart_delay:
+                self.start()
+        with self.lock:
+            return [self.gpus[i] for i in sorted(self.gpus)]
+
+    def processes(self):
+        if self.apps_reader is None:
+            self.apps = self._query_apps()
+            self.apps_reader = threading.Thread(target=self._refresh_apps, name='nvidia-smi-apps', daemon=True)
+            self.apps_reader.start()
+        with self.lock:
+            return self.apps
+
+    def _refresh_apps(self):
+        while not self.stopped.wait(self.apps_interval):
+            apps = self._query_apps()
+            with self.lock:
+                self.apps = apps
+
+    def _query_apps(self):
+        # One-shot query, the -lms stream can only carry one --query-* kind
+        try:
+            result = subprocess.run(
+                [self.command, '--query-compute-apps=gpu_uuid,pid,used_memory', '--format=csv,noheader,nounits'],
+                capture_output=True, text=True, timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            return []
+        apps = []
+        for row in csv.reader(result.stdout.splitlines(), skipinitialspace=True):
+            if len(row) != 3:
+                continue
+            try:
+                pid = int(row[1])
+            except ValueError:
+                continue
+            memory = parse_gpu_value(row[2])
+            apps.append({'uuid': row[0], 'pid': pid, 'memory': memory / 1024 if memory is not None else None})
+        return apps
+
+    def close(self):
+        self.stopped.set()
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+class NvmlBackend(GpuBackend):
+    """Read GPU records through the NVML Python bindings (pip install nvidia-ml-py)."""
+
+    def __init__(self):
+        self.nvml = None
+
+    def start(self):
+        import pynvml
+        pynvml.nvmlInit()
+        self.nvml = pynvml
+
+    def read(self):
+        nvml = self.nvml
+        gpus = []
+        for index in range(nvml.nvmlDeviceGetCount()):
+            try:
+                handle = nvml.nvmlDeviceGetHandleByIndex(index)
+            except nvml.NVMLError:
+                continue  # GPU fell off the bus
+            def query(function, *args, scale=1):
+                try:
+                    return function(handle, *args) / scale
+                except nvml.NVMLError:
+                    return None  # not supported on this GPU, keep whatever was readable
+
+            record = {'index': index, 'uuid': None, 'name': None, 'pci_bus_id': None, 'utilization': None,
+                      'memory_used': None, 'memory_total': None}
+            try:
+                record['uuid'] = nvml.nvmlDeviceGetUUID(handle)
+                record['name'] = nvml.nvmlDeviceGetName(handle)
+                bus_id = nvml.nvmlDeviceGetPciInfo(handle).busId
+                record['pci_bus_id'] = bus_id.decode() if isinstance(bus_id, bytes) else bus_id
+                memory = nvml.nvmlDeviceGetMemoryInfo(handle)
+                record['memory_used'] = memory.used / 1024 ** 3
+                record['memory_total'] = memory.total / 1024 ** 3
+                record['utilization'] = float(nvml.nvmlDeviceGetUtilizationRates(handle).gpu)
+            except nvml.NVMLError:
+                pass
+            record.update({
+                'power': query(nvml.nvmlDeviceGetPowerUsage, scale=1000),
+                'power_limit': query(nvml.nvmlDeviceGetEnforcedPowerLimit, scale=1000),
+                'sm_clock': query(nvml.nvmlDeviceGetClockInfo, nvml.NVML_CLOCK_SM),
+                'memory_clock': query(nvml.nvmlDeviceGetClockInfo, nvml.NVML_CLOCK_MEM),
+                'temperature': query(nvml.nvmlDeviceGetTemperature, nvml.NVML_TEMPERATURE_GPU),
+                'throttle': query(nvml.nvmlDeviceGetCurrentClocksThrottleReasons),
+                'energy': query(nvml.nvmlDeviceGetTotalEnergyConsumption, scale=1000),
+            })
+            if record['throttle'] is not None:
+                record['throttle'] = int(record['throttle'])
+            gpus.append(record)
+        return gpus
+
+    def processes(self):
+        nvml = self.nvml
+        apps = []
+        for index in range(nvml.nvmlDeviceGetCount()):
+            try:
+                handle = nvml.nvmlDeviceGetHandleByIndex(index)
+                uuid = nvml.nvmlDeviceGetUUID(handle)
+                running = nvml.nvmlDeviceGetComputeRunningProcesses(handle)
+            except nvml.NVMLError:
+                continue
+            for process in running:
+                memory = process.usedGpuMemory  # None when the driver hides it (e.g. in a container)
+                apps.append({'uuid': uuid, 'pid': process.pid,
+                             'memory': memory / 1024 ** 3 if memory is not None else None})
+        return apps
+
+    def close(self):
+        if self.nvml is not None:
+            self.nvml.nvmlShutdown()
+
+def open_gpu_backend(name, interval=1):
+    """Create and start the named GPU backend, or None if it is unavailable."""
+    backend = NvmlBackend() if name == 'nvml' else NvidiaSmiBackend(interval)
+    try:
+        backend.start()
+    except Exception:
+        return None
+    return backend
+
+PROM_SAMPLE = re.compile(r'([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)')
+PROM_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+PROM_LABEL_ESCAPE = re.compile(r'\\(.)')
 
-def refresh_window(interval, tot_before, tot_after, pnic_before, pnic_after):
-    """Calculate and print network stats."""
-    nic_names = list(pnic_after.keys())
-    nic_names.sort()
+def prom_unescape(value):
+    """Undo the exposition format's label value escaping (backslash, quote and newline)."""
+    if '\\' not in value:
+        return value
+    return PROM_LABEL_ESCAPE.sub(lambda match: '\n' if match.group(1) == 'n' else match.group(1), value)
 
-    network_stats = {}
+class PromMetrics:
+    """Prometheus samples indexed by sample name, then by label set.
 
-    for name in nic_names:
-        if name == 'lo' or name == 'docker0' or not psutil.net_if_addrs().get(name):
+    Label sets are stored as sorted tuples of (name, value) pairs. Histogram
+    families keep their _bucket, _sum and _count samples under those names.
+    """
+
+    def __init__(self):
+        self.types = {}
+        self.samples = {}
+
+    def add(self, name, labels, value):
+        self.samples.setdefault(name, {})[labels] = value
+
+    def series(self, name, **labels):
+        """Yield (labels, value) for every sample of name matching the given labels."""
+        wanted = labels.items()
+        for label_set, value in self.samples.get(name, {}).items():
+            if not wanted or wanted <= dict(label_set).items():
+                yield label_set, value
+
+    def get(self, name, **labels):
+        """Return the first matching sample value, or None."""
+        for _, value in self.series(name, **labels):
+            return value
+        return None
+
+    def sum(self, name, **labels):
+        """Return the sum of all matching sample values, or None if there are none."""
+        values = [value for _, value in self.series(name, **labels)]
+        return sum(values) if values else None
+
+    def histogram(self, name, **labels):
+        """Return ([(upper_bound, cumulative_count), ...], sum, count) summed over matching series."""
+        buckets = {}
+        for label_set, value in self.series(f"{name}_bucket", **labels):
+            le = float(dict(label_set)['le'])
+            buckets[le] = buckets.get(le, 0.0) + value
+        return (sorted(buckets.items()),
+                self.sum(f"{name}_sum", **labels) or 0.0,
+                self.sum(f"{name}_count", **labels) or 0.0)
+
+def parse_prometheus(lines, prefix='vllm:'):
+    """Parse Prometheus text exposition lines in one pass, keeping families that start with prefix."""
+    metrics = PromMetrics()
+    type_prefix = f"# TYPE {prefix}"
+    for line in lines:
+        if not line.startswith(prefix):
+            if line.startswith(type_prefix):
+                _, _, name, metric_type = line.split(None, 3)
+                metrics.types[name] = metric_type.strip()
             continue
+        match = PROM_SAMPLE.match(line)
+        if not match:
+            continue
+        name, label_text, value = match.groups()
+        labels = tuple(sorted((label, prom_unescape(text)) for label, text in PROM_LABEL.findall(label_text))) \
+            if label_text else ()
+        try:
+            metrics.add(name, labels, float(value))
+        except ValueError:
+            continue
+    return metrics
 
-        stats_before = pnic_before[name]
-        stats_after = pnic_after[name]
+class PromScraper:
+    """Fetch a Prometheus /metrics endpoint over a keep-alive session.
 
-        sent_speed_bps = (stats_after.bytes_sent - stats_before.bytes_sent) / interval * 8
-        recv_speed_bps = (stats_after.bytes_recv - stats_before.bytes_recv) / interval * 8
+    Requests use strict connect/read timeouts plus an overall deadline while
+    the body is streamed into parse_prometheus(). Responses are requested
+    gzip-compressed, and ETag/Last-Modified validators are sent back so an
+    unchanged exposition costs a 304 and reuses the previous parse.
+    """
 
-        sent_speed_human = convert_bps(sent_speed_bps)
-        recv_speed_human = convert_bps(recv_speed_bps)
+    def __init__(self, url, connect_timeout=0.5, read_timeout=1.0, prefix='vllm:'):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.prefix = prefix
+        import requests  # only needed with --api-url
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip'
+        self.validators = {}
+        self.last = None
 
-        network_stats[name] = (sent_speed_human, recv_speed_human)
+    def scrape(self):
+        """Return a PromMetrics for the endpoint, raising requests.RequestException on failure."""
+        import requests
+        deadline = time.monotonic() + sum(self.timeout)
+        headers = self.validators if self.last is not None else {}
+        with self.session.get(self.url, timeout=self.timeout, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                return self.last
+            response.raise_for_status()
+            response.encoding = response.encoding or 'utf-8'
 
-    return network_stats
+            def lines():
+                for line in response.iter_lines(decode_unicode=True):
+                    if time.monotonic() > deadline:
+                        raise requests.Timeout(f"reading {self.url} took longer than {sum(self.timeout)}s")
+                    yield line
 
-def get_server_type():
-    command = "cat /sys/devices/virtual/dmi/id/product_name"
-    result = subprocess.check_output(command, shell=True, encoding='utf-8').strip()
-    return result
+            metrics = parse_prometheus(lines(), self.prefix)
 
-def get_cpu_type():
-    command = "lscpu | grep 'Model name:' | awk -F': ' '{print $2}'"
-    result = subprocess.check_output(command, shell=True).decode().strip()
-    return result
+        self.validators = {}
+        if 'ETag' in response.headers:
+            self.validators['If-None-Match'] = response.headers['ETag']
+        if 'Last-Modified' in response.headers:
+            self.validators['If-Modified-Since'] = response.headers['Last-Modified']
+        self.last = metrics
+        return metrics
 
-def get_cpu_cores():
-    command = "lscpu | grep 'Core(s) per socket:' | awk -F': ' '{print $2}'"
-    result = subprocess.check_output(command, shell=True).decode().strip()
-    return result
+    def close(self):
+        self.session.close()
 
-def get_cpu_sockets():
-    command = "lscpu | grep 'Socket(s):' | awk -F': ' '{print $2}'"
-    result = subprocess.check_output(command, shell=True).decode().strip()
-    return result
+def model_names(metrics):
+    """Return the model_name label values in a scrape, or [None] if samples are not labelled by model."""
+    names = {dict(labels).get('model_name') for series in metrics.samples.values() for labels in series}
+    names.discard(None)
+    return sorted(names) or [None]
+
+def vllm_summary(metrics, model_name=None):
+    """Pick the headline vLLM numbers out of a scraped PromMetrics, for one model if given."""
+    labels = {'model_name': model_name} if model_name is not None else {}
+    kv_cache = metrics.sum('vllm:kv_cache_usage_perc', **labels)
+    if kv_cache is None:
+        kv_cache = metrics.sum('vllm:gpu_cache_usage_perc', **labels)  # vLLM V0 name
+    return {
+        'throughput': metrics.sum('vllm:avg_generation_throughput_toks_per_s', **labels),
+        'running': metrics.sum('vllm:num_requests_running', **labels),
+        'waiting': metrics.sum('vllm:num_requests_waiting', **labels),
+        'kv_cache': kv_cache,
+        'prompt_tokens': metrics.sum('vllm:prompt_tokens_total', **labels),
+        'generation_tokens': metrics.sum('vllm:generation_tokens_total', **labels),
+    }
+
+LATENCY_HISTOGRAMS = (
+    ('ttft', ('vllm:time_to_first_token_seconds',)),
+    ('tpot', ('vllm:inter_token_latency_seconds', 'vllm:time_per_output_token_seconds')),  # V1 name first
+    ('e2e', ('vllm:e2e_request_latency_seconds',)),
+)
+LATENCY_QUANTILES = (('p50', 0.5), ('p90', 0.9), ('p99', 0.99))
+
+def histogram_quantile(q, buckets):
+    """Estimate the q-quantile (0..1) from cumulative [(upper_bound, count)] buckets, as PromQL does."""
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for upper_bound, count in buckets:
+        if count >= rank:
+            if math.isinf(upper_bound):
+                return lower_bound  # in the +Inf bucket, the highest finite bound is the best estimate
+            if count == lower_count:
+                return upper_bound
+            return lower_bound + (upper_bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = upper_bound, count
+    return lower_bound
+
+def latency_summary(buckets):
+    """Return {'count', 'buckets', 'p50', 'p90', 'p99'} for windowed cumulative buckets."""
+    summary = {'count': buckets[-1][1] if buckets else 0.0, 'buckets': buckets}
+    for key, q in LATENCY_QUANTILES:
+        summary[key] = histogram_quantile(q, buckets)
+    return summary
+
+class HistogramWindow:
+    """Histogram bucket counts observed over the last window seconds of scrapes.
+
+    Counts are accumulated like RateEngine totals: a bucket lower than in
+    the previous scrape means the server restarted, and its new count is
+    taken as the increase since the reset. update() returns the difference
+    between the newest accumulated counts and those at the start of the
+    window, so quantiles cover only requests finished in the window.
+    """
+
+    def __init__(self, window=60):
+        self.window = window
+        self.state = {}
+
+    def update(self, key, buckets, timestamp):
+        """Record cumulative [(upper_bound, count)] buckets and return those of the window."""
+        bounds = tuple(upper_bound for upper_bound, _ in buckets)
+        counts = [count for _, count in buckets]
+        state = self.state.get(key)
+        if state is None or state['bounds'] != bounds:
+            zeros = [0.0] * len(counts)
+            self.state[key] = {'bounds': bounds, 'counts': counts, 'total': zeros,
+                               'history': collections.deque([(timestamp, zeros)])}
+            return [(upper_bound, 0.0) for upper_bound in bounds]
+
+        reset = any(count < previous for count, previous in zip(counts, state['counts']))
+        total = [accumulated + (count if reset else count - previous)
+                 for accumulated, count, previous in zip(state['total'], counts, state['counts'])]
+        state['counts'], state['total'] = counts, total
+        history = state['history']
+        history.append((timestamp, total))
+        while len(history) > 2 and timestamp - history[1][0] >= self.window:
+            history.popleft()
+        return [(upper_bound, now - start) for upper_bound, now, start in zip(bounds, total, history[0][1])]
+
+    def forget(self, keep):
+        """Drop state for histograms whose key is not in keep."""
+        for key in [key for key in self.state if key not in keep]:
+            del self.state[key]
+
+def merge_latency(summaries):
+    """Sum the windowed buckets of several latency summaries into one."""
+    merged = {}
+    for summary in summaries:
+        for upper_bound, count in summary['buckets']:
+            merged[upper_bound] = merged.get(upper_bound, 0.0) + count
+    return latency_summary(sorted(merged.items()))
+
+def parse_slo(text):
+    """Parse a --slo METRIC:QUANTILE=SECONDS argument such as ttft:p99=0.5."""
+    target, _, threshold = text.partition('=')
+    name, _, quantile = target.partition(':')
+    try:
+        threshold = float(threshold)
+    except ValueError:
+        threshold = 0
+    if name not in dict(LATENCY_HISTOGRAMS) or quantile not in dict(LATENCY_QUANTILES) or threshold <= 0:
+        raise argparse.ArgumentTypeError(f"expected ttft|tpot|e2e:p50|p90|p99=SECONDS, got {text!r}")
+    return name, quantile, threshold
+
+def check_slos(latency, slos):
+    """Return one {'metric', 'quantile', 'threshold', 'value', 'violated'} entry per configured SLO."""
+    results = []
+    for name, quantile, threshold in slos:
+        value = (latency.get(name) or {}).get(quantile)
+        results.append({'metric': name, 'quantile': quantile, 'threshold': threshold, 'value': value,
+                        'violated': value is not None and value > threshold})
+    return results
+
+def vllm_totals(endpoints):
+    """Sum the per-model numbers of the endpoints that are up into one headline entry.
+
+    Rates and request counts are summed; KV cache usage is averaged over
+    the models and latency histograms are merged before taking quantiles.
+    The per-endpoint results are kept under 'endpoints'.
+    """
+    models = [model for endpoint in endpoints if endpoint['up'] for model in endpoint['models'].values()]
+
+    def total(field):
+        values = [model[field] for model in models if model[field] is not None]
+        return sum(values) if values else None
+
+    kv_cache = [model['kv_cache'] for model in models if model['kv_cache'] is not None]
+    totals = {field: total(field) for field in ('throughput', 'prompt_tokens_per_s', 'generation_tokens_per_s',
+                                                  'running', 'waiting')}
+    totals.update({
+        'up': any(endpoint['up'] for endpoint in endpoints),
+        'kv_cache': sum(kv_cache) / len(kv_cache) if kv_cache else None,
+        'latency': {name: merge_latency([model['latency'][name] for model in models if name in model['latency']])
+                    for name, _ in LATENCY_HISTOGRAMS if any(name in model['latency'] for model in models)},
+        'endpoints': endpoints,
+    })
+    return totals
+
+def read_targets(path):
+    """Return the URLs listed one per line in a targets file, skipping blank lines and # comments."""
+    with open(path) as f:
+        return [line.split('#', 1)[0].strip() for line in f if line.split('#', 1)[0].strip()]
+
+# ai-monitor-vllm.py loads this class from here
+class RateEngine:
+    """Per-second rates of monotonic counters from consecutive samples.
+
+    Every counter is identified by a key and keeps its previous value and
+    timestamp, so a rate costs one sample per tick and never sleeps. A value
+    lower than the previous one is treated as a counter reset (e.g. a vLLM
+    restart) and the new value is taken as the increase since the reset.
+
+    smoothing is 'none' for the instantaneous rate between two samples,
+    'ewma' for an exponentially weighted average with a time constant of
+    window seconds, or 'window' for the average rate over the last window
+    seconds.
+    """
+
+    def __init__(self, smoothing='ewma', window=5):
+        self.smoothing = smoothing
+        self.window = window
+        self.state = {}
+
+    def update(self, key, value, timestamp=None):
+        """Record a counter sample and return its rate, or None for the first sample."""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        state = self.state.get(key)
+        if state is None:
+            self.state[key] = {'value': value, 'time': timestamp, 'total': 0.0,
+                               'rate': None, 'history': collections.deque([(timestamp, 0.0)])}
+            return None
+
+        elapsed = timestamp - state['time']
+        if elapsed <= 0:
+            return state['rate']
+        increase = value - state['value'] if value >= state['value'] else value  # reset
+        state['value'], state['time'] = value, timestamp
+        state['total'] += increase
+        rate = increase / elapsed
+
+        if self.smoothing == 'ewma' and state['rate'] is not None:
+            alpha = 1 - math.exp(-elapsed / self.window)
+            rate = state['rate'] + alpha * (rate - state['rate'])
+        elif self.smoothing == 'window':
+            history = state['history']
+            history.append((timestamp, state['total']))
+            while len(history) > 2 and timestamp - history[1][0] >= self.window:
+                history.popleft()
+            rate = (state['total'] - history[0][1]) / (timestamp - history[0][0])
+        state['rate'] = rate
+        return rate
+
+    def forget(self, keep):
+        """Drop state for counters whose key is not in keep."""
+        for key in [key for key in self.state if key not in keep]:
+            del self.state[key]
+
+class RingBuffer:
+    """Fixed-capacity (time, value) series backed by preallocated arrays.
+
+    append() is O(1) and memory never grows; once full the oldest sample is
+    overwritten. Queries walk backwards from the newest sample and stop at
+    the edge of the requested window.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array.array('d', bytes(8 * capacity))
+        self.values = array.array('d', bytes(8 * capacity))
+        self.head = 0  # next slot to write
+        self.count = 0
+
+    def append(self, timestamp, value):
+        self.times[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def latest(self, n=None):
+        """Yield (time, value) pairs from newest to oldest, at most n of them."""
+        n = self.count if n is None else min(n, self.count)
+        for i in range(1, n + 1):
+            slot = (self.head - i) % self.capacity
+            yield self.times[slot], self.values[slot]
+
+    def window(self, seconds, now=None):
+        """Return the values sampled during the last seconds, oldest first."""
+        if not self.count:
+            return []
+        if now is None:
+            now = self.times[(self.head - 1) % self.capacity]
+        values = []
+        for timestamp, value in self.latest():
+            if timestamp < now - seconds:
+                break
+            values.append(value)
+        values.reverse()
+        return values
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+def window_stats(values):
+    """Return min, max, mean, p95 and p99 of a list of values, or None if it is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return {
+        'min': ordered[0],
+        'max': ordered[-1],
+        'mean': sum(ordered) / len(ordered),
+        'p95': percentile(ordered, 95),
+        'p99': percentile(ordered, 99),
+    }
+
+def snapshot_series(snapshot):
+    """Yield (series_key, value) for every numeric metric in a snapshot."""
+    cpu = snapshot.get('cpu')
+    if cpu:
+        yield 'cpu', cpu['average']
+        for socket_id, usage in cpu['sockets'].items():
+            yield f"cpu.socket{socket_id}", usage
+        for node, usage in (cpu.get('nodes') or {}).items():
+            yield f"cpu.node{node}", usage
+    memory = snapshot.get('memory')
+    if memory:
+        yield 'memory.used', memory['used']
+        yield 'memory.total', memory['total']
+    for gpu in snapshot.get('gpu') or []:
+        for field in ('utilization', 'memory_used', 'memory_total', 'energy_power', 'power', 'power_limit',
+                      'sm_clock', 'memory_clock', 'temperature'):
+            yield f"gpu{gpu['index']}.{field}", gpu.get(field)
+    for node, stats in (snapshot.get('numa') or {}).items():
+        for field in ('memory_used', 'allocation_bps', 'remote_percent'):
+            yield f"numa.node{node}.{field}", stats[field]
+    for name, (sent_bps, recv_bps) in (snapshot.get('nic') or {}).items():
+        yield f"nic.{name}.tx", sent_bps
+        yield f"nic.{name}.rx", recv_bps
+    for cgroup in snapshot.get('cgroup') or []:
+        name = cgroup['name'].replace(' ', '_')
+        for field in ('cpu', 'throttled', 'memory', 'read_bps', 'write_bps'):
+            yield f"cgroup.{name}.{field}", cgroup[field]
+        if cgroup['net']:
+            yield f"cgroup.{name}.tx", cgroup['net'][0]
+            yield f"cgroup.{name}.rx", cgroup['net'][1]
+    # A process using several GPUs is listed under each; its series sum them under the first
+    processes = {}
+    for index, top in ((snapshot.get('process') or {}).get('gpus') or {}).items():
+        for process in top:
+            totals = processes.setdefault(process['pid'], {'gpu': index, 'gpu_memory': None,
+                                                           'cpu': process['cpu'], 'rss': process['rss']})
+            if process['gpu_memory'] is not None:
+                totals['gpu_memory'] = (totals['gpu_memory'] or 0.0) + process['gpu_memory']
+    for pid, totals in processes.items():
+        for field in ('gpu', 'gpu_memory', 'cpu', 'rss'):
+            yield f"process.{pid}.{field}", totals[field]
+    node = snapshot.get('efficiency')
+    if node:
+        for field in ('power', 'joules_per_token', 'tokens_per_watt'):
+            yield f"efficiency.{field}", node[field]
+    vllm = snapshot.get('vllm')
+    if vllm and vllm['up']:
+        for field in ('throughput', 'prompt_tokens_per_s', 'running', 'waiting', 'kv_cache'):
+            yield f"vllm.{field}", vllm[field]
+        for name, latency in (vllm.get('latency') or {}).items():
+            for quantile, _ in LATENCY_QUANTILES:
+                yield f"vllm.{name}_{quantile}", latency[quantile]
+    stats = snapshot.get('self')
+    if stats:
+        yield 'self.cpu', stats['cpu']
+        yield 'self.rss', stats['rss']
+
+class History:
+    """One RingBuffer per metric series, sized to hold `seconds` of samples.
+
+    Series sampled faster than the tick are recorded as the mean of their
+    samples over the tick. Per-cgroup and per-process series have no trend
+    on screen and are not kept, so hundreds of containers cost no ring
+    buffers. A series whose newest sample is older than `seconds`, such as
+    a removed veth interface, is dropped with its buffer.
+    """
+    UNTRENDED = ('cgroup.', 'process.')
+
+    def __init__(self, interval=1, seconds=300, ticks=SPARK_TICKS):
+        self.capacity = int(math.ceil(seconds / interval)) + 1
+        self.seconds = seconds
+        self.ticks = ticks
+        self.series = {}
+
+    def record(self, snapshot):
+        timestamp = snapshot['time']
+        for key, value in snapshot_series(snapshot):
+            if value is None or key.startswith(self.UNTRENDED):
+                continue
+            value = folded(snapshot, key, value)
+            buffer = self.series.get(key)
+            if buffer is None:
+                buffer = self.series[key] = RingBuffer(self.capacity)
+            buffer.append(timestamp, value)
+        for key in [key for key, buffer in self.series.items()
+                    if next(buffer.latest(1))[0] < timestamp - self.seconds]:
+            del self.series[key]
+
+    def stats(self, key, seconds):
+        """Return window_stats() over the last seconds of a series."""
+        buffer = self.series.get(key)
+        return window_stats(buffer.window(seconds)) if buffer else None
+
+    def sparkline(self, key, width=20):
+        """Render the newest width samples of a series, scaled to their own range."""
+        ticks = self.ticks
+        buffer = self.series.get(key)
+        if not buffer:
+            return ' ' * width
+        values = [value for _, value in buffer.latest(width)][::-1]
+        low, high = min(values), max(values)
+        span = (high - low) or 1
+        line = ''.join(ticks[int((value - low) / span * (len(ticks) - 1))] for value in values)
+        return line.rjust(width)
+
+def format_trend(history, key, fmt="{:.1f}", width=20):
+    """Return '<sparkline>  1m avg/max  5m avg/max' for a series."""
+    parts = [history.sparkline(key, width)]
+    for label, seconds in (('1m', 60), ('5m', 300)):
+        stats = history.stats(key, seconds)
+        if stats:
+            parts.append(f"{label} {fmt.format(stats['mean'])}/{fmt.format(stats['max'])}")
+    return "  ".join(parts)
+
+def folded(snapshot, key, value):
+    """Return the mean of a series' samples over the last interval if it is sampled faster, else value."""
+    stats = (snapshot.get('fold') or {}).get(key)
+    return stats['mean'] if stats else value
+
+def format_fold(snapshot, key, fmt="{:.1f}", label=""):
+    """Return '  min/p99/max ...' for a series sampled faster than the display interval.
+
+    fmt is a format string or a function formatting one value.
+    """
+    stats = (snapshot.get('fold') or {}).get(key)
+    if not stats:
+        return ""
+    render = fmt.format if isinstance(fmt, str) else fmt
+    return f"  {label}min/p99/max {render(stats['min'])}/{render(stats['p99'])}/{render(stats['max'])}"
+
+def format_gpu_power(gpu):
+    """Return '312/700W 64C 1980MHz [power cap]' for a GPU record, skipping what is not reported."""
+    parts = []
+    if gpu.get('power') is not None:
+        limit = f"/{gpu['power_limit']:.0f}" if gpu.get('power_limit') is not None else ""
+        parts.append(f"{gpu['power']:.0f}{limit}W")
+    if gpu.get('temperature') is not None:
+        parts.append(f"{gpu['temperature']:.0f}C")
+    if gpu.get('sm_clock') is not None:
+        parts.append(f"{gpu['sm_clock']:.0f}MHz")
+    reasons = throttle_reasons(gpu.get('throttle'))
+    if reasons:
+        parts.append(f"[{', '.join(reasons)}]")
+    return " ".join(parts)
+
+def format_efficiency(node):
+    """Return the node power line, with energy per token when vLLM reports tokens/s."""
+    line = f" PWR   {node['power']:.0f}W"
+    if node.get('joules_per_token') is not None:
+        line += f"  {node['joules_per_token']:.2f} J/token, {node['tokens_per_watt']:.3f} tokens/s per W"
+    return line
+
+def format_vllm_details(vllm):
+    details = []
+    if vllm['running'] is not None:
+        details.append(f"running: {vllm['running']:.0f}, waiting: {vllm['waiting'] or 0:.0f}")
+    if vllm['kv_cache'] is not None:
+        details.append(f"KV cache: {vllm['kv_cache'] * 100:.1f}%")
+    if vllm['prompt_tokens_per_s'] is not None:
+        details.append(f"prompt: {vllm['prompt_tokens_per_s']:.2f} tokens/s")
+    return "  ".join(details)
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "N/A"
+    return f"{seconds * 1e3:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+def format_latency(latency):
+    """Return 'TTFT p50/p90/p99 ...' for a latency entry, or '' if no request finished in the window."""
+    parts = []
+    for name, _ in LATENCY_HISTOGRAMS:
+        summary = latency.get(name)
+        if summary and summary['p50'] is not None:
+            parts.append(f"{name.upper()} " + "/".join(format_seconds(summary[q]) for q, _ in LATENCY_QUANTILES))
+    return "  ".join(parts)
+
+def format_slo(vllm):
+    """Return one line per violated latency SLO."""
+    lines = []
+    for slo in (vllm or {}).get('slo') or []:
+        if slo['violated']:
+            lines.append(f" SLO: {slo['metric'].upper()} {slo['quantile']} {format_seconds(slo['value'])}"
+                         f" > {format_seconds(slo['threshold'])}")
+    return lines
+
+def format_vllm(vllm):
+    """Return the LLM lines for the display from a vllm snapshot entry.
+
+    With several endpoints or models the headline totals are followed by
+    one line per endpoint and model.
+    """
+    endpoints = (vllm or {}).get('endpoints') or []
+    status = "API" if len(endpoints) <= 1 else f"{sum(endpoint['up'] for endpoint in endpoints)}/{len(endpoints)} APIs"
+    if not vllm or not vllm['up']:
+        return [f" LLM: N/A [{status} down]" if len(endpoints) <= 1 else f" LLM: N/A [{status} up]"]
+    throughput = vllm['throughput']
+    throughput = f"{throughput:.2f} tokens/s" if throughput is not None else "N/A tokens/s"
+    lines = [f" LLM: {throughput} [{status} up]"]
+    details = format_vllm_details(vllm)
+    if details:
+        lines.append("      " + details)
+    latency = format_latency(vllm.get('latency') or {})
+    if latency:
+        lines.append("      p50/p90/p99  " + latency)
+    if len(endpoints) > 1 or any(len(endpoint['models']) > 1 for endpoint in endpoints):
+        for endpoint in endpoints:
+            stale = " (stale)" if endpoint['stale'] else ""
+            if not endpoint['up']:
+                lines.append(f"      {endpoint['name']}: API down{stale}")
+                continue
+            for model, summary in endpoint['models'].items():
+                throughput = summary['throughput']
+                throughput = f"{throughput:8.2f} tokens/s" if throughput is not None else "     N/A tokens/s"
+                label = f"{endpoint['name']} {model or ''}".strip()
+                latency = format_latency(summary['latency'])
+                lines.append(f"      {label:<40} {throughput}  {format_vllm_details(summary)}{stale}")
+                if latency:
+                    lines.append(f"      {'':<40} p50/p90/p99  {latency}")
+    return lines
+
+def format_processes(processes):
+    """Return the process view lines for a snapshot's 'process' entry."""
+    lines = []
+    for index, top in processes['gpus'].items():
+        label = f"GPU{index + 1}" if index is not None else "GPU?"
+        for process in top:
+            gpu_memory = f"{process['gpu_memory']:.1f}Gi" if process['gpu_memory'] is not None else "N/A"
+            cpu = f"{process['cpu']:.0f}%" if process['cpu'] is not None else "N/A"
+            rss = format_bytes(process['rss']) if process['rss'] is not None else "N/A"
+            command = (process['command'] or '?')[:40]
+            if process['status'] in (psutil.STATUS_ZOMBIE, 'not visible', 'gone'):
+                command += f" ({process['status']})"
+            server = f" [{process['server']['name']}]" if process['server'] else ""
+            lines.append(f" {label:<5} {process['pid']:>7} {gpu_memory:>8}  CPU {cpu:>5}  RSS {rss:>7}  {command}{server}")
+            label = ""
+    for server in processes['servers']:
+        gpus = ','.join(f"GPU{index + 1}" for index in server['gpus'])
+        lines.append(f" {server['name']}: {server['gpu_memory']:.1f}Gi on {gpus or 'N/A'}, CPU {server['cpu']:.0f}%, "
+                     f"RSS {format_bytes(server['rss'])}, {len(server['pids'])} processes")
+    return lines
+
+def format_cgroups(cgroups, top):
+    """Return one line per cgroup for the top cgroups by CPU; slice rows note the containers they include."""
+    lines = []
+    for cgroup in cgroups[:top]:
+        suffix = f" (+{cgroup['containers']} ctr)" if cgroup.get('containers') else ""
+        name = cgroup['name'][:34 - len(suffix)] + suffix
+        cpu = f"{cgroup['cpu']:.0f}%" if cgroup['cpu'] is not None else "N/A"
+        if cgroup['cpu_limit'] is not None:
+            cpu += f"/{cgroup['cpu_limit'] * 100:.0f}%"
+        throttled = f"{cgroup['throttled']:.0f}%" if cgroup['throttled'] is not None else ""
+        memory = format_bytes(cgroup['memory'])
+        if cgroup['memory_limit'] is not None:
+            memory += f"/{format_bytes(cgroup['memory_limit'])}"
+        io = "N/A"
+        if cgroup['read_bps'] is not None and cgroup['write_bps'] is not None:
+            io = f"{format_bytes(cgroup['read_bps'])}/{format_bytes(cgroup['write_bps'])}/s"
+        net = f"{convert_bps(cgroup['net'][0])}/{convert_bps(cgroup['net'][1])}" if cgroup['net'] else ""
+        if cgroup['kind'] == 'container' and cgroup['netns'] is None:
+            net = "netns unknown"
+        lines.append(f" {name:<34} {cpu:>10} {throttled:>5}  {memory:<15} {io:<17} {net}")
+    return lines
+
+class Collector:
+    """Base class for a metric source run by the Scheduler."""
+    name = None
+
+    def collect(self):
+        """Return the current value of this source."""
+        raise NotImplementedError
+
+    def fold(self):
+        """Return per-series stats of samples taken between ticks, if the collector samples faster."""
+        return None
+
+    def close(self):
+        """Release any resources held by the collector."""
+        pass
+
+class CpuCollector(Collector):
+    name = 'cpu'
+
+    def __init__(self, sampler):
+        self.sampler = sampler
+        sampler.cpu_usage()  # prime the jiffy counters so the first tick covers one interval
+
+    def collect(self):
+        return self.sampler.cpu_usage()
+
+class MemoryCollector(Collector):
+    name = 'memory'
+
+    def __init__(self, sampler):
+        self.sampler = sampler
+
+    def collect(self):
+        return self.sampler.memory()
+
+class GpuCollector(Collector):
+    """Per-GPU records with energy and average power.
+
+    When the backend has no energy counter (nvidia-smi), power draw is
+    integrated over time with the trapezoidal rule into energy since the
+    monitor started. energy_power is the smoothed rate of that energy.
+    """
+    name = 'gpu'
+
+    def __init__(self, backend, rates=None):
+        self.backend = backend
+        self.rates = rates or RateEngine()
+        self.integrated = {}  # {uuid: (time, power, energy)}
+
+    def collect(self):
+        if not self.backend:
+            return []
+        now = time.monotonic()
+        gpus = []
+        for gpu in self.backend.read():
+            gpu = dict(gpu, energy_power=None)
+            if gpu['energy'] is None and gpu['power'] is not None:
+                then, power, energy = self.integrated.get(gpu['uuid'], (now, gpu['power'], 0.0))
+                energy += (power + gpu['power']) / 2 * (now - then)
+                self.integrated[gpu['uuid']] = (now, gpu['power'], energy)
+                gpu['energy'] = energy
+            if gpu['energy'] is not None:
+                gpu['energy_power'] = self.rates.update((gpu['uuid'], 'energy'), gpu['energy'], now)
+            gpus.append(gpu)
+        return gpus
+
+    def close(self):
+        if self.backend:
+            self.backend.close()
+
+class ProcessTable:
+    """psutil.Process objects for the pids asked about, reused across ticks.
+
+    Only GPU processes and the vLLM servers they belong to are looked at,
+    never the whole process table, so hosts with thousands of processes
+    cost no more than idle ones. A process is opened once, its command line
+    and vLLM server are worked out when it is first seen, and every later
+    tick only reads its CPU time and RSS.
+    """
+
+    def __init__(self):
+        self.processes = {}  # {pid: (psutil.Process, facts)}
+
+    @staticmethod
+    def server(process):
+        """Return the outermost vLLM process above or at process as {'pid', 'name'}, or None.
+
+        The engine core and worker processes are children of the API
+        server, so they all map to the same server. Its name is the --port
+        it listens on.
+        """
+        server = None
+        try:
+            chain = [process] + process.parents()
+        except psutil.Error:
+            chain = [process]
+        for each in chain:
+            try:
+                cmdline = each.cmdline()
+                name = each.name()
+            except psutil.Error:
+                continue
+            if 'vllm' in name.lower() or any('vllm' in arg.lower() for arg in cmdline):
+                port = '8000'
+                for i, arg in enumerate(cmdline):
+                    if arg == '--port' and i + 1 < len(cmdline):
+                        port = cmdline[i + 1]
+                    elif arg.startswith('--port='):
+                        port = arg.split('=', 1)[1]
+                server = {'pid': each.pid, 'name': f"vllm :{port}"}
+        return server
+
+    def get(self, pid):
+        """Return (process, facts, new) for pid, or None if it is gone or not visible here."""
+        entry = self.processes.get(pid)
+        if entry is not None and entry[0].is_running():
+            return entry + (False,)
+        try:
+            process = psutil.Process(pid)
+            with process.oneshot():
+                name = process.name()
+                try:
+                    cmdline = process.cmdline()
+                except psutil.Error:
+                    cmdline = []
+                process.cpu_percent(None)  # start the CPU accounting window
+            command = ' '.join([os.path.basename(cmdline[0])] + cmdline[1:]) if cmdline else name
+            entry = self.processes[pid] = (process, {'name': name, 'command': command,
+                                                     'server': self.server(process)})
+        except psutil.Error:
+            self.processes.pop(pid, None)
+            return None
+        return entry + (True,)
+
+    def sample(self, pid):
+        """Return pid, name, command, server, status, cpu (%) and rss (bytes) of a process."""
+        entry = self.get(pid)
+        if entry is None:
+            return {'pid': pid, 'name': None, 'command': None, 'server': None,
+                    'status': 'not visible', 'cpu': None, 'rss': None}
+        process, facts, new = entry
+        sample = dict(facts, pid=pid, status=None, cpu=None, rss=None)
+        try:
+            with process.oneshot():
+                sample['status'] = process.status()
+                cpu = process.cpu_percent(None)
+                sample['cpu'] = cpu if not new else None  # the first call covers no time
+                sample['rss'] = process.memory_info().rss
+        except psutil.ZombieProcess:
+            sample['status'] = psutil.STATUS_ZOMBIE
+        except psutil.Error:
+            self.processes.pop(pid, None)
+            sample['status'] = 'gone'
+        return sample
+
+    def forget(self, keep):
+        for pid in set(self.processes) - set(keep):
+            del self.processes[pid]
+
+class ProcessCollector(Collector):
+    """Which processes hold GPU memory, with their CPU and RSS.
+
+    Combines the GPU backend's compute processes with a ProcessTable and
+    returns {'gpus': {index: [top processes by GPU memory]}, 'servers': [...]}
+    where every server sums the GPU memory, CPU and RSS of a vLLM API
+    server and all of its GPU processes.
+    """
+    name = 'process'
+
+    def __init__(self, backend, top=3):
+        self.backend = backend
+        self.top = top
+        self.table = ProcessTable()
+
+    def collect(self):
+        if not self.backend:
+            return None
+        indexes = {gpu['uuid']: gpu['index'] for gpu in self.backend.read()}
+        samples = {}
+        gpus = {}
+        for app in self.backend.processes():
+            if app['pid'] not in samples:
+                samples[app['pid']] = self.table.sample(app['pid'])
+            process = dict(samples[app['pid']], gpu=indexes.get(app['uuid']), gpu_memory=app['memory'])
+            gpus.setdefault(process['gpu'], []).append(process)
+
+        servers = {}
+        for process in itertools.chain.from_iterable(gpus.values()):
+            if process['server'] is None:
+                continue
+            server = servers.setdefault(process['server']['pid'], {
+                'name': process['server']['name'], 'pid': process['server']['pid'],
+                'gpu_memory': 0.0, 'gpus': set(), 'pids': set()})
+            server['gpu_memory'] += process['gpu_memory'] or 0.0
+            server['gpus'].add(process['gpu'])
+            server['pids'].add(process['pid'])
+        for server in servers.values():
+            server['pids'].add(server['pid'])  # the API server itself usually holds no GPU memory
+            for pid in server['pids']:
+                if pid not in samples:
+                    samples[pid] = self.table.sample(pid)
+            server['cpu'] = sum(samples[pid]['cpu'] or 0.0 for pid in server['pids'])
+            server['rss'] = sum(samples[pid]['rss'] or 0 for pid in server['pids'])
+            server['gpus'] = sorted(index for index in server['gpus'] if index is not None)
+            server['pids'] = sorted(server['pids'])
+        self.table.forget(samples)
+
+        return {
+            'gpus': {index: sorted(processes, key=lambda process: process['gpu_memory'] or 0.0,
+                                   reverse=True)[:self.top]
+                     for index, processes in sorted(gpus.items(), key=lambda item: (item[0] is None, item[0] or 0))},
+            'servers': sorted(servers.values(), key=lambda server: server['gpu_memory'], reverse=True),
+        }
+
+NUMA_PAGE_SIZE = 4096  # numastat counts pages
+
+def pci_address(bus_id):
+    """Convert an nvidia-smi/NVML PCI bus ID (00000000:18:00.0) to the sysfs name (0000:18:00.0)."""
+    parts = bus_id.strip().lower().split(':')
+    if len(parts) == 2:
+        parts.insert(0, '0')
+    try:
+        return f"{int(parts[0], 16):04x}:{parts[1]}:{parts[2]}"
+    except (ValueError, IndexError):
+        return bus_id
+
+class NumaCollector(Collector):
+    """Per-NUMA-node memory and the GPUs and NICs attached to each node.
+
+    Nodes come from /sys/devices/system/node, GPUs are placed through the
+    numa_node of their PCI bus ID under /sys/bus/pci/devices and NICs through
+    /sys/class/net/*/device. sysfs has no memory bandwidth counter, so the
+    numastat page allocation rate of each node and the share of it made by
+    CPUs of other nodes stand in for it. A device's node is read once.
+    """
+    name = 'numa'
+
+    def __init__(self, backend, rates=None, root='/'):
+        self.backend = backend
+        self.rates = rates or RateEngine()
+        self.root = root
+        self.placement = {}  # {sysfs device path: node or None}
+
+    def device_node(self, path):
+        if path not in self.placement:
+            try:
+                node = int(read_file(os.path.join(path, 'numa_node')))
+            except (OSError, ValueError):
+                node = -1
+            self.placement[path] = node if node >= 0 else None  # -1: no NUMA or a virtual device
+        return self.placement[path]
+
+    def node_stats(self, node, now):
+        node_dir = os.path.join(self.root, 'sys', 'devices', 'system', 'node', f'node{node}')
+        meminfo = {}
+        try:
+            with open(os.path.join(node_dir, 'meminfo')) as f:
+                for line in f:
+                    fields = line.split()  # Node 0 MemTotal:  131072000 kB
+                    if len(fields) >= 4 and fields[3].isdigit():
+                        meminfo[fields[2].rstrip(':')] = int(fields[3]) * 1024
+        except OSError:
+            pass
+        numastat = {}
+        try:
+            with open(os.path.join(node_dir, 'numastat')) as f:
+                for line in f:
+                    key, _, value = line.partition(' ')
+                    numastat[key] = int(value)
+        except (OSError, ValueError):
+            pass
+        local = remote = None
+        if 'local_node' in numastat and 'other_node' in numastat:
+            local = self.rates.update((node, 'local'), numastat['local_node'], now)
+            remote = self.rates.update((node, 'remote'), numastat['other_node'], now)
+        allocations = local + remote if local is not None and remote is not None else None
+        return {
+            'memory_used': meminfo.get('MemUsed'),
+            'memory_total': meminfo.get('MemTotal'),
+            'allocation_bps': allocations * NUMA_PAGE_SIZE if allocations is not None else None,
+            'remote_percent': 100.0 * remote / allocations if allocations else None,
+            'gpus': [],
+            'nics': [],
+        }
+
+    def collect(self):
+        now = time.monotonic()
+        try:
+            nodes = sorted(int(entry[4:]) for entry in os.listdir(os.path.join(self.root, 'sys', 'devices', 'system', 'node'))
+                           if entry.startswith('node') and entry[4:].isdigit())
+        except OSError:
+            return None
+        nodes = {node: self.node_stats(node, now) for node in nodes}
+        used = set()
+        for gpu in self.backend.read() if self.backend else []:
+            if gpu.get('pci_bus_id'):
+                path = os.path.join(self.root, 'sys', 'bus', 'pci', 'devices', pci_address(gpu['pci_bus_id']))
+                used.add(path)
+                node = self.device_node(path)
+                if node in nodes:
+                    nodes[node]['gpus'].append(gpu['index'])
+        net_dir = os.path.join(self.root, 'sys', 'class', 'net')
+        try:
+            nics = sorted(os.listdir(net_dir))
+        except OSError:
+            nics = []
+        for name in nics:
+            path = os.path.join(net_dir, name, 'device')
+            used.add(path)
+            node = self.device_node(path)
+            if node in nodes:
+                nodes[node]['nics'].append(name)
+        self.placement = {path: node for path, node in self.placement.items() if path in used}
+        return nodes
+
+def placement_warnings(snapshot, remote_percent=20):
+    """Return warnings about GPUs, NICs and vLLM servers placed across NUMA nodes.
+
+    A GPU without a NIC on its own node sends RDMA traffic over the
+    inter-socket link, as does a vLLM server whose GPUs sit on several
+    nodes. Nodes where more than remote_percent of the page allocations
+    come from other nodes' CPUs are flagged too.
+    """
+    nodes = snapshot.get('numa') or {}
+    if len(nodes) < 2:
+        return []
+    warnings = []
+    gpu_node = {index: node for node, stats in nodes.items() for index in stats['gpus']}
+    nic_nodes = {node for node, stats in nodes.items() if stats['nics']}
+    for index, node in sorted(gpu_node.items()):
+        if nic_nodes and node not in nic_nodes:
+            nics = ', '.join(f"{name} (node {other})" for other in sorted(nic_nodes) for name in nodes[other]['nics'])
+            warnings.append(f"GPU{index + 1} on node {node} has no NIC on its node, NICs: {nics}")
+    for server in (snapshot.get('process') or {}).get('servers') or []:
+        spanned = sorted({gpu_node[index] for index in server['gpus'] if index in gpu_node})
+        if len(spanned) > 1:
+            warnings.append(f"{server['name']} uses GPUs on NUMA nodes {','.join(map(str, spanned))}")
+    for node, stats in nodes.items():
+        if stats['remote_percent'] is not None and stats['remote_percent'] > remote_percent:
+            warnings.append(f"node {node}: {stats['remote_percent']:.0f}% of memory allocations from other nodes")
+    return warnings
+
+def format_numa(snapshot):
+    """Return one line per NUMA node: CPU load, memory, allocation rate, GPUs and NICs."""
+    cpu_nodes = (snapshot.get('cpu') or {}).get('nodes') or {}
+    lines = []
+    for node, stats in (snapshot.get('numa') or {}).items():
+        cpu = cpu_nodes.get(node)
+        cpu = f"{cpu:.1f}%" if cpu is not None else "N/A"
+        if stats['memory_used'] is not None and stats['memory_total'] is not None:
+            memory = f"{format_bytes(stats['memory_used'])}/{format_bytes(stats['memory_total'])}"
+        else:
+            memory = "N/A"
+        allocations = f"{format_bytes(stats['allocation_bps'])}/s" if stats['allocation_bps'] is not None else "N/A"
+        if stats['remote_percent'] is not None:
+            allocations += f" ({stats['remote_percent']:.0f}% remote)"
+        devices = [f"GPU{index + 1}" for index in stats['gpus']] + stats['nics']
+        lines.append(f" Node{node:<2} CPU {cpu:>6}  Mem {memory:<13} Alloc {allocations:<22} {' '.join(devices)}")
+    return lines
+
+NIC_ROLLUP_PATTERNS = ('veth*', 'cali*', 'cni*', 'flannel*', 'vxlan*', 'tunl*', 'lxc*', 'tap*', 'gke*', 'eni*')
+
+def read_net_dev(path):
+    """Return {interface: (rx_bytes, tx_bytes)} from one read of /proc/net/dev."""
+    counters = {}
+    with open(path) as f:
+        for line in itertools.islice(f, 2, None):  # two header lines
+            name, _, fields = line.partition(':')
+            fields = fields.split()
+            counters[name.strip()] = (int(fields[0]), int(fields[8]))
+    return counters
+
+class NicCollector(Collector):
+    """Per-NIC tx/rx bits per second from byte counters sampled every tick.
+
+    All counters come from a single read of /proc/net/dev under root.
+    Interface metadata (IPv4 address, rollup group) is cached and only
+    refreshed when the set of interfaces changes or every metadata_ttl
+    seconds, so a tick costs one pass over the file. Interfaces matching
+    an exclude glob are dropped; if include globs are given only matching
+    interfaces are shown, otherwise only those with an IPv4 address.
+    Virtual interfaces matching rollup (veth*, cali*, ...) are summed into
+    one entry per pattern instead of one row each.
+
+    The IPv4 addresses come from the running host, so under another root
+    (a fixture tree) the address filter is skipped.
+    """
+    name = 'nic'
+
+    def __init__(self, rates=None, root='/', include=(), exclude=('lo', 'docker0'),
+                 rollup=NIC_ROLLUP_PATTERNS, metadata_ttl=30):
+        self.rates = rates or RateEngine()
+        self.path = os.path.join(root, 'proc', 'net', 'dev')
+        self.host = os.path.abspath(root) == '/'
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.rollup = tuple(rollup)
+        self.metadata_ttl = metadata_ttl
+        self.names = None
+        self.refreshed = 0
+        self.shown = []    # interfaces reported on their own
+        self.groups = {}   # {pattern: [member interfaces]}
+        self.previous = {}  # last counters of rolled-up interfaces
+        self.totals = {}   # {pattern: [rx_bytes, tx_bytes]} summed increases of the members
+        self.collect()  # prime the counters so the first tick reports a rate
+
+    def refresh(self, names):
+        """Classify every interface once; called when the interface set changes."""
+        def matches(name, patterns):
+            return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+        ipv4 = {name for name, addrs in psutil.net_if_addrs().items()
+                if any(addr.family == socket.AF_INET for addr in addrs)} if self.host else None
+        self.shown = []
+        self.groups = {}
+        for name in sorted(names):
+            if matches(name, self.exclude):
+                continue
+            if self.include:
+                if matches(name, self.include):
+                    self.shown.append(name)
+                continue
+            group = next((pattern for pattern in self.rollup if fnmatch.fnmatchcase(name, pattern)), None)
+            if group:
+                self.groups.setdefault(group, []).append(name)
+            elif ipv4 is None or name in ipv4:
+                self.shown.append(name)
+        self.names = names
+        self.refreshed = time.monotonic()
+        self.previous = {name: self.previous[name] for name in self.previous if name in names}
+        self.totals = {group: self.totals.get(group, [0, 0]) for group in self.groups}
+        self.rates.forget({(name, direction) for name in self.shown + list(self.groups)
+                           for direction in ('tx', 'rx')})
+
+    def collect(self):
+        now = time.monotonic()
+        counters = read_net_dev(self.path)
+        if counters.keys() != self.names or now - self.refreshed >= self.metadata_ttl:
+            self.refresh(set(counters))
+        network_stats = {}
+        for name in self.shown:
+            rx, tx = counters[name]
+            sent_bps = self.rates.update((name, 'tx'), tx * 8, now)
+            recv_bps = self.rates.update((name, 'rx'), rx * 8, now)
+            network_stats[name] = (sent_bps or 0.0, recv_bps or 0.0)
+        for group, members in self.groups.items():
+            # Sum the members' increases rather than their counters, so
+            # interfaces coming and going do not look like a counter reset
+            total = self.totals[group]
+            for name in members:
+                current = counters[name]
+                previous = self.previous.get(name)
+                if previous is not None:
+                    for i in (0, 1):
+                        total[i] += current[i] - previous[i] if current[i] >= previous[i] else current[i]
+                self.previous[name] = current
+            sent_bps = self.rates.update((group, 'tx'), total[1] * 8, now)
+            recv_bps = self.rates.update((group, 'rx'), total[0] * 8, now)
+            network_stats[group] = (sent_bps or 0.0, recv_bps or 0.0)
+        return network_stats
+
+CONTAINER_SCOPE = re.compile(r'(docker|cri-containerd|crio|libpod)-([0-9a-f]{12,})\.scope$')
+CONTAINER_RUNTIMES = {'docker': 'docker', 'cri-containerd': 'containerd', 'crio': 'crio', 'libpod': 'podman'}
+KUBERNETES_POD = re.compile(r'-pod([0-9a-f_]+)\.slice$')
+
+def read_small(path):
+    """Read a small pseudo-file with one os.read, cheaper than open() for hundreds of files per tick."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.read(fd, 65536).decode()
+    finally:
+        os.close(fd)
+
+def read_keyed(path):
+    """Return {key: int} from a flat-keyed cgroup file such as cpu.stat or memory.stat."""
+    values = {}
+    for line in read_small(path).splitlines():
+        key, _, value = line.partition(' ')
+        if value.isdigit():
+            values[key] = int(value)
+    return values
+
+def read_limit(path, scale=1):
+    """Return a cgroup limit file (memory.max, cpu.max) as a number, or None when it is max or missing."""
+    try:
+        fields = read_file(path).split()
+    except OSError:
+        return None
+    if not fields or fields[0] == 'max':
+        return None
+    return int(fields[0]) / (int(fields[1]) if len(fields) > 1 else scale)
+
+class CgroupCollector(Collector):
+    """Per-container and per-slice CPU, throttling, memory, IO and network from cgroup v2.
+
+    The tree under sys/fs/cgroup is scanned every rescan seconds (or when a
+    cgroup disappears) for the top-level slices and the container scopes
+    of Docker, containerd, CRI-O and Podman, and their CPU and memory limits
+    are read. Between scans a tick only reads cpu.stat, memory.current,
+    memory.stat and io.stat of the cgroups already known, so hundreds of
+    containers cost a few reads each.
+
+    CPU is in percent of one core, throttled is the share of CFS periods
+    that were throttled. Network counters come from /proc/PID/net/dev of
+    one process in the container, which shows its network namespace;
+    containers in the host namespace have none, and neither do those whose
+    namespace cannot be compared with the host's (netns is then None). A
+    slice's numbers include the containers under it, so every container
+    records its slice and every slice the number of containers it includes.
+    """
+    name = 'cgroup'
+
+    def __init__(self, rates=None, root='/', rescan=10):
+        self.rates = rates or RateEngine()
+        self.root = root
+        self.base = os.path.join(root, 'sys', 'fs', 'cgroup')
+        self.rescan = rescan
+        self.scanned = None
+        self.cgroups = {}  # {relative path: {'name', 'kind', 'pid', 'netns'}}
+        try:
+            self.host_netns = os.stat(os.path.join(root, 'proc', 'self', 'ns', 'net')).st_ino
+        except OSError:
+            self.host_netns = None
+
+    def scan(self):
+        cgroups = {}
+        for path, dirs, _ in os.walk(self.base):
+            relative = os.path.relpath(path, self.base)
+            if relative == '.':
+                dirs[:] = [name for name in dirs if name.endswith('.slice')]
+                for name in dirs:
+                    cgroups[name] = self.cgroups.get(name) or {'name': name, 'kind': 'slice'}
+                continue
+            match = CONTAINER_SCOPE.search(relative)
+            if match:
+                dirs[:] = []  # processes inside a container may create their own cgroups
+                pod = KUBERNETES_POD.search(os.path.dirname(relative))
+                name = f"{CONTAINER_RUNTIMES[match.group(1)]} {match.group(2)[:12]}"
+                if pod:
+                    name = f"pod {pod.group(1)[:8]} {name}"
+                cgroups[relative] = self.cgroups.get(relative) or {'name': name, 'kind': 'container'}
+        for relative, cgroup in cgroups.items():
+            if cgroup['kind'] == 'container':
+                top = relative.split(os.sep, 1)[0]
+                cgroup['slice'] = top if top in cgroups else None
+            else:
+                cgroup['containers'] = sum(1 for other in cgroups if other.startswith(relative + os.sep))
+            cgroup['cpu_limit'] = read_limit(os.path.join(self.base, relative, 'cpu.max'))
+            cgroup['memory_limit'] = read_limit(os.path.join(self.base, relative, 'memory.max'))
+        self.cgroups = cgroups
+        self.scanned = time.monotonic()
+
+    def netns(self, relative, cgroup):
+        """Return the /proc/PID/net/dev path of the container's network namespace, or None."""
+        pid = cgroup.get('pid')
+        if pid is None:
+            try:
+                with open(os.path.join(self.base, relative, 'cgroup.procs')) as f:
+                    pid = cgroup['pid'] = int(f.readline())
+            except (OSError, ValueError):
+                cgroup['netns'] = False
+                return None  # no processes, or a slice of nested cgroups only
+            try:
+                inode = os.stat(os.path.join(self.root, 'proc', str(pid), 'ns', 'net')).st_ino
+            except OSError:
+                inode = None  # not allowed to look
+            # Unknown unless both namespaces could be read, so host traffic is never counted for a container
+            cgroup['netns'] = None if inode is None or self.host_netns is None else inode != self.host_netns
+        if not cgroup['netns']:
+            return None
+        return os.path.join(self.root, 'proc', str(pid), 'net', 'dev')
+
+    def read(self, relative, cgroup, now):
+        path = os.path.join(self.base, relative)
+        cpu = read_keyed(os.path.join(path, 'cpu.stat'))
+        memory_stat = read_keyed(os.path.join(path, 'memory.stat'))
+        memory = int(read_small(os.path.join(path, 'memory.current')))
+        io = [0, 0]
+        try:
+            for line in read_small(os.path.join(path, 'io.stat')).splitlines():
+                for field in line.split()[1:]:
+                    key, _, value = field.partition('=')
+                    if key in ('rbytes', 'wbytes'):
+                        io[key == 'wbytes'] += int(value)
+        except OSError:
+            pass  # io controller not enabled for this cgroup
+
+        def rate(field, value):
+            return self.rates.update((relative, field), value, now) if value is not None else None
+
+        usage = rate('usage', cpu.get('usage_usec'))
+        periods = rate('periods', cpu.get('nr_periods'))
+        throttled = rate('throttled', cpu.get('nr_throttled'))
+        stats = {
+            'path': relative,
+            'name': cgroup['name'],
+            'kind': cgroup['kind'],
+            'cpu': usage / 1e4 if usage is not None else None,  # usec per second to percent of a core
+            'cpu_limit': cgroup['cpu_limit'],
+            'throttled': 100.0 * throttled / periods if periods and throttled is not None else None,
+            'memory': memory,
+            'memory_limit': cgroup['memory_limit'],
+            'anon': memory_stat.get('anon'),
+            'file': memory_stat.get('file'),
+            'read_bps': rate('read', io[0]),
+            'write_bps': rate('write', io[1]),
+            'net': None,
+        }
+        if cgroup['kind'] != 'container':
+            stats['containers'] = cgroup['containers']
+            return stats
+        stats['slice'] = cgroup['slice']
+        net_dev = self.netns(relative, cgroup)
+        stats['netns'] = cgroup.get('netns')
+        if net_dev:
+            try:
+                counters = read_net_dev(net_dev)
+            except (OSError, ValueError, IndexError):
+                cgroup['pid'] = None  # the process exited, pick another one next tick
+            else:
+                rx = sum(counter[0] for name, counter in counters.items() if name != 'lo')
+                tx = sum(counter[1] for name, counter in counters.items() if name != 'lo')
+                stats['net'] = (rate('tx', tx * 8) or 0.0, rate('rx', rx * 8) or 0.0)
+                stats['interfaces'] = sorted(name for name in counters if name != 'lo')
+        return stats
+
+    def collect(self):
+        now = time.monotonic()
+        if self.scanned is None or now - self.scanned >= self.rescan:
+            self.scan()
+        results = []
+        for relative, cgroup in list(self.cgroups.items()):
+            try:
+                results.append(self.read(relative, cgroup, now))
+            except (OSError, ValueError):
+                self.scanned = None  # removed, rescan on the next tick
+                del self.cgroups[relative]
+        self.rates.forget({(relative, field) for relative in self.cgroups
+                           for field in ('usage', 'periods', 'throttled', 'read', 'write', 'tx', 'rx')})
+        return sorted(results, key=lambda stats: stats['cpu'] or 0.0, reverse=True)
+
+class VllmCollector(Collector):
+    """Scrape one or more vLLM /metrics endpoints concurrently every tick.
+
+    Every endpoint is fetched on its own worker thread with its own
+    timeouts, and collect() waits at most budget seconds for them. An
+    endpoint still being fetched keeps its previous result and is marked
+    stale, so one slow replica never delays the others. Results are broken
+    down per endpoint and per model_name and summed by vllm_totals().
+    TTFT, TPOT and end-to-end latency quantiles come from the histogram
+    buckets observed over the last latency_window seconds and are checked
+    against the configured SLOs.
+    """
+    name = 'vllm'
+
+    def __init__(self, urls, rates=None, timeout=1.0, budget=0.8, latency_window=60, slos=()):
+        self.scrapers = [PromScraper(url, connect_timeout=min(0.5, timeout), read_timeout=timeout)
+                         for url in urls]
+        self.rates = rates or RateEngine()
+        self.latency = HistogramWindow(latency_window)
+        self.slos = slos
+        self.budget = budget
+        self.executor = ThreadPoolExecutor(max_workers=len(self.scrapers), thread_name_prefix='scrape')
+        self.pending = {}
+        self.last = {}
+
+    @staticmethod
+    def scrape(scraper):
+        import requests
+        try:
+            return scraper.scrape(), None, time.monotonic()
+        except requests.RequestException as e:
+            return None, str(e), time.monotonic()
+        except (ValueError, TypeError) as e:  # UnicodeDecodeError is a ValueError too
+            return None, f"malformed exposition: {e}", time.monotonic()
+
+    def endpoint(self, url, metrics, error, timestamp):
+        """Reduce one scrape to per-model summaries with token rates."""
+        endpoint = {'url': url, 'name': urlsplit(url).netloc or url, 'up': metrics is not None,
+                    'error': error, 'metrics': metrics, 'models': {}}
+        if metrics is None:
+            return endpoint
+        for model in model_names(metrics):
+            summary = vllm_summary(metrics, model)
+            for counter in ('generation_tokens', 'prompt_tokens'):
+                if summary[counter] is not None:
+                    summary[f"{counter}_per_s"] = self.rates.update((url, model, counter), summary[counter], timestamp)
+                else:
+                    summary[f"{counter}_per_s"] = None
+            if summary['generation_tokens_per_s'] is not None:
+                summary['throughput'] = summary['generation_tokens_per_s']
+            labels = {'model_name': model} if model is not None else {}
+            summary['latency'] = {}
+            for name, families in LATENCY_HISTOGRAMS:
+                for family in families:
+                    buckets, _, _ = metrics.histogram(family, **labels)
+                    if buckets:
+                        summary['latency'][name] = latency_summary(
+                            self.latency.update((url, model, name), buckets, timestamp))
+                        break
+            summary['slo'] = check_slos(summary['latency'], self.slos)
+            endpoint['models'][model] = summary
+        return endpoint
+
+    def collect(self):
+        for scraper in self.scrapers:
+            if scraper.url not in self.pending:
+                self.pending[scraper.url] = self.executor.submit(self.scrape, scraper)
+
+        wait(list(self.pending.values()), timeout=self.budget)
+
+        endpoints = []
+        for scraper in self.scrapers:
+            future = self.pending[scraper.url]
+            stale = not future.done()
+            if not stale:
+                del self.pending[scraper.url]
+                metrics, error, timestamp = future.result()
+                try:
+                    self.last[scraper.url] = self.endpoint(scraper.url, metrics, error, timestamp)
+                except (KeyError, ValueError, TypeError) as e:  # e.g. a histogram bucket without a numeric le
+                    self.last[scraper.url] = self.endpoint(scraper.url, None, f"malformed exposition: {e}", timestamp)
+            endpoint = self.last.get(scraper.url) or self.endpoint(scraper.url, None, "no response yet", None)
+            endpoints.append(dict(endpoint, stale=stale))
+        self.rates.forget({(endpoint['url'], model, counter) for endpoint in endpoints
+                           for model in endpoint['models'] for counter in ('generation_tokens', 'prompt_tokens')})
+        self.latency.forget({(endpoint['url'], model, name) for endpoint in endpoints
+                             for model in endpoint['models'] for name, _ in LATENCY_HISTOGRAMS})
+        totals = vllm_totals(endpoints)
+        totals['slo'] = check_slos(totals['latency'], self.slos)
+        return totals
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for scraper in self.scrapers:
+            scraper.close()
+
+class FastCollector(Collector):
+    """Sample another collector on its own thread every period seconds.
+
+    collect() returns the newest sample immediately, so the Scheduler tick
+    never waits on it. Every sample is also flattened into series and kept
+    until the next fold(), which reduces them to min/max/mean/p99 for the
+    display interval. If a sink is given it receives each raw sample as
+    (timestamp, name, [(series, value)]) from the sampling thread.
+    """
+
+    def __init__(self, collector, period, sink=None):
+        self.collector = collector
+        self.name = collector.name
+        self.period = period
+        self.sink = sink
+        self.lock = threading.Lock()
+        self.latest = self.error = None
+        self.samples = {}
+        self.stopped = threading.Event()
+        self.sample()
+        self.thread = threading.Thread(target=self.run, name=f'sample-{self.name}', daemon=True)
+        self.thread.start()
+
+    def sample(self):
+        try:
+            value, error = self.collector.collect(), None
+        except Exception as e:
+            value, error = None, e
+        timestamp = time.time()
+        series = [(key, v) for key, v in snapshot_series({self.name: value}) if v is not None] if value else []
+        with self.lock:
+            self.latest, self.error = value, error
+            for key, v in series:
+                self.samples.setdefault(key, []).append(v)
+        if self.sink and series:
+            self.sink(timestamp, self.name, series)
+
+    def run(self):
+        next_sample = time.monotonic()
+        while True:
+            next_sample += self.period
+            delay = next_sample - time.monotonic()
+            if delay < 0:
+                next_sample, delay = time.monotonic(), 0  # fell behind, skip the missed samples
+            if self.stopped.wait(delay):
+                return
+            self.sample()
+
+    def collect(self):
+        with self.lock:
+            if self.error:
+                raise self.error
+            return self.latest
+
+    def fold(self):
+        with self.lock:
+            samples, self.samples = self.samples, {}
+        return {key: window_stats(values) for key, values in samples.items()}
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join(timeout=1)
+        self.collector.close()
+
+class LatencyHistogram:
+    """HDR-style latency histogram with about 6% relative precision.
+
+    Values are recorded in microseconds into a fixed array of log-linear
+    buckets: 16 linear sub-buckets per power of two, so recording is O(1) and
+    memory is constant however many samples are taken.
+    """
+    SUB_BITS = 4
+    SUB_BUCKETS = 1 << SUB_BITS
+    BUCKETS = 512
+
+    def __init__(self):
+        self.counts = array.array('Q', bytes(8 * self.BUCKETS))
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def bucket(self, micros):
+        if micros < 2 * self.SUB_BUCKETS:
+            return micros
+        shift = micros.bit_length() - (self.SUB_BITS + 1)
+        return min(self.SUB_BUCKETS * (shift + 1) + (micros >> shift) - self.SUB_BUCKETS, self.BUCKETS - 1)
+
+    def bucket_value(self, index):
+        """Return the lowest value, in microseconds, counted in bucket index."""
+        if index < 2 * self.SUB_BUCKETS:
+            return index
+        shift = index // self.SUB_BUCKETS - 1
+        return (index % self.SUB_BUCKETS + self.SUB_BUCKETS) << shift
+
+    def record(self, seconds):
+        self.counts[self.bucket(int(seconds * 1e6))] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        """Return the q-th percentile in seconds, or None if nothing was recorded."""
+        if not self.count:
+            return None
+        rank = max(math.ceil(q / 100 * self.count), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bucket_value(index + 1) / 1e6, self.max)
+        return self.max
 
-def get_cpu_average():
-    command = "mpstat 1 1 | awk '/^Average:/ {usage=100-$NF} END {print usage}'"
-    result = subprocess.check_output(command, shell=True).decode().strip()
+class SelfStats:
+    """The monitor's own overhead: phase latencies, tick overruns, CPU and RSS."""
+
+    def __init__(self, phases):
+        self.latency = {phase: LatencyHistogram() for phase in phases}
+        self.ticks = 0
+        self.overruns = 0
+        self.process = psutil.Process()
+        self.process.cpu_percent(None)  # start the CPU accounting window
+
+    def record(self, phase, seconds):
+        histogram = self.latency.get(phase)
+        if histogram is None:
+            histogram = self.latency[phase] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def summary(self):
+        return {
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'cpu': self.process.cpu_percent(None),
+            'rss': self.process.memory_info().rss,
+            'latency': {phase: {'count': histogram.count, 'sum': histogram.total, 'max': histogram.max,
+                                'p50': histogram.percentile(50), 'p99': histogram.percentile(99)}
+                        for phase, histogram in self.latency.items()},
+        }
+
+def format_self_stats(stats):
+    """Return the debug pane lines for a snapshot's 'self' entry."""
+    lines = [f" Monitor: {stats['ticks']} ticks, {stats['overruns']} overruns, "
+             f"CPU {stats['cpu']:.1f}%, RSS {format_bytes(stats['rss'])}"]
+    for phase, latency in stats['latency'].items():
+        if latency['count']:
+            lines.append(f"   {phase:<8} p50 {latency['p50'] * 1e3:8.2f}ms  p99 {latency['p99'] * 1e3:8.2f}ms"
+                         f"  max {latency['max'] * 1e3:8.2f}ms  n={latency['count']}")
+    startup = stats['latency'].get('startup')
+    if startup and startup['count'] and startup['max'] > STARTUP_BUDGET:
+        lines.append(f"   startup took {startup['max'] * 1e3:.0f}ms, over the {STARTUP_BUDGET * 1e3:.0f}ms budget")
+    return lines
+
+def efficiency(snapshot):
+    """Energy per generated token for the node and per GPU, or None without power and tokens/s.
+
+    Both GPU energy and generated tokens are counters turned into rates
+    over the same smoothing window, so power / tokens per second is the
+    energy used in the window divided by the tokens generated in it. Tokens
+    are only known per node, so a GPU's joules_per_token is its share of the
+    node figure (its power over the node's tokens/s); the shares add up to
+    the node value.
+    """
+    gpus = [gpu for gpu in snapshot.get('gpu') or [] if gpu.get('energy_power') is not None]
+    vllm = snapshot.get('vllm')
+    if not gpus:
+        return None
+    power = sum(gpu['energy_power'] for gpu in gpus)
+    tokens = vllm.get('throughput') if vllm and vllm['up'] else None
+    result = {'power': power, 'joules_per_token': None, 'tokens_per_watt': None, 'gpus': {}}
+    if tokens:
+        result['joules_per_token'] = power / tokens
+        result['tokens_per_watt'] = tokens / power if power else None
+        for gpu in gpus:
+            result['gpus'][gpu['index']] = {'joules_per_token': gpu['energy_power'] / tokens}
     return result
 
-def get_gpu_info():
-    command = "nvidia-smi --query-gpu=gpu_name,memory.used,utilization.gpu,memory.total --format=csv,noheader,nounits"
+class SlidingHistogram(LatencyHistogram):
+    """LatencyHistogram of signed values that can be removed again, for percentiles over a window.
+
+    Negative values are counted by magnitude in a second bucket array.
+    Values are bucketed in millionths, one per bucket below 32e-6 and in
+    buckets 1/32 to 1/16 of the value wide above. percentile()
+    interpolates linearly between the bounds of the bucket the rank falls
+    in.
+    """
+    BUCKETS = 1024  # generic values up to about 1e17, e.g. NIC rates in bit/s
+
+    def __init__(self):
+        super().__init__()
+        self.negative = array.array('Q', bytes(8 * self.BUCKETS))
+        self.negatives = 0
+
+    def _add(self, value, count):
+        if value < 0:
+            self.negative[self.bucket(int(-value * 1e6))] += count
+            self.negatives += count
+        else:
+            self.counts[self.bucket(int(value * 1e6))] += count
+        self.count += count
+        self.total += value * count
+
+    def record(self, value):
+        self._add(value, 1)
+
+    def remove(self, value):
+        self._add(value, -1)
+
+    def _buckets(self):
+        """Yield (count, low, high) in millionths for every bucket, in ascending value order."""
+        if self.negatives:
+            for index in range(self.BUCKETS - 1, -1, -1):
+                yield self.negative[index], -self.bucket_value(index + 1), -self.bucket_value(index)
+        for index in range(self.BUCKETS):
+            yield self.counts[index], self.bucket_value(index), self.bucket_value(index + 1)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for count, low, high in self._buckets():
+            if count and seen + count >= rank:
+                return (low + (high - low) * (rank - seen) / count) / 1e6
+            seen += count
+        return None
+
+class WindowAggregate:
+    """The last value, mean, rate, min, max or a percentile of one series over the last seconds.
+
+    Every sample is added once and subtracted once when it leaves the
+    window: from a running sum, a SlidingHistogram, or a monotonic deque for
+    min and max. Updates are O(1) amortized and a percentile scans a fixed
+    number of buckets, whatever the window length. rate treats the series as
+    a counter and goes through a RateEngine, so a counter reset counts as
+    the new value rather than a large negative rate.
+    """
+
+    def __init__(self, function='last', seconds=0):
+        self.function = function
+        self.seconds = seconds
+        self.samples = collections.deque()
+        self.sum = 0.0
+        self.extremes = collections.deque()
+        self.histogram = SlidingHistogram() if function.startswith('p') else None
+        self.rates = RateEngine(smoothing='window', window=seconds) if function == 'rate' else None
+        self.rate = None
+
+    def update(self, timestamp, value):
+        self.samples.append((timestamp, value))
+        self.sum += value
+        if self.histogram:
+            self.histogram.record(value)
+        if self.rates:
+            self.rate = self.rates.update('value', value, timestamp)
+        if self.function in ('min', 'max'):
+            sign = 1 if self.function == 'max' else -1
+            while self.extremes and self.extremes[-1][1] * sign <= value * sign:
+                self.extremes.pop()
+            self.extremes.append((timestamp, value))
+        start = timestamp - self.seconds
+        while len(self.samples) > 1 and self.samples[0][0] <= start:
+            _, old = self.samples.popleft()
+            self.sum -= old
+            if self.histogram:
+                self.histogram.remove(old)
+        while len(self.extremes) > 1 and self.extremes[0][0] <= start:
+            self.extremes.popleft()
+
+    def value(self):
+        if not self.samples:
+            return None
+        if self.function == 'mean':
+            return self.sum / len(self.samples)
+        if self.function == 'rate':
+            return self.rate
+        if self.function in ('min', 'max'):
+            return self.extremes[0][1]
+        if self.histogram:
+            return self.histogram.percentile(int(self.function[1:]))
+        return self.samples[-1][1]
+
+ALERT_CONDITION = re.compile(
+    r'(?:(?P<function>mean|rate|min|max|p\d{1,2})\(\s*(?P<windowed>[^\s,()]+)\s*,\s*(?P<seconds>[0-9.]+)\s*\)'
+    r'|(?P<series>[^\s<>=()]+))\s*(?P<op><=|>=|<|>)\s*(?P<threshold>[-+0-9.eE]+)'
+    r'(?:\s+clear\s+(?P<clear>[-+0-9.eE]+))?')
+ALERT_OPERATORS = {'>': float.__gt__, '>=': float.__ge__, '<': float.__lt__, '<=': float.__le__}
+
+def parse_alert(text):
+    """Parse an --alert rule: NAME: CONDITION [and CONDITION ...] [for SECONDS].
+
+    A condition is SERIES OP NUMBER or FUNCTION(SERIES, SECONDS) OP NUMBER,
+    optionally followed by clear NUMBER, the value the series has to cross
+    back over before a firing alert resolves.
+    """
+    name, _, body = text.partition(':')
+    duration = 0.0
+    match = re.search(r'\s+for\s+([0-9.]+)\s*$', body)
+    if match:
+        duration = float(match.group(1))
+        body = body[:match.start()]
+    conditions = []
+    for part in re.split(r'\s+and\s+', body.strip()):
+        condition = ALERT_CONDITION.fullmatch(part.strip())
+        if not name.strip() or condition is None:
+            raise argparse.ArgumentTypeError(
+                f"expected NAME: [FUNCTION(]SERIES[, SECONDS)] OP NUMBER [clear NUMBER] [and ...] [for SECONDS], got {text!r}")
+        try:
+            threshold = float(condition['threshold'])
+            clear = float(condition['clear']) if condition['clear'] else None
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"bad number in alert rule {text!r}")
+        conditions.append({
+            'text': part.strip(),
+            'function': condition['function'] or 'last',
+            'series': condition['windowed'] or condition['series'],
+            'seconds': float(condition['seconds'] or 0),
+            'op': condition['op'],
+            'threshold': threshold,
+            'clear': clear,
+        })
+    return {'name': name.strip(), 'text': body.strip(), 'conditions': conditions, 'for': duration}
+
+def read_alert_rules(path):
+    """Read --alert rules from a file, one per line; blank lines and # comments are skipped."""
+    rules = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if line:
+                try:
+                    rules.append(parse_alert(line))
+                except argparse.ArgumentTypeError as e:
+                    sys.exit(f"{path}:{number}: {e}")
+    return rules
+
+class AlertSink:
+    """Base class for a destination of alert events (dicts with alert, state, time, rule, values)."""
+
+    def send(self, event):
+        raise NotImplementedError
+
+class LogSink(AlertSink):
+    """Append every event as a JSON line to a file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, event):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(event) + '\n')
+
+class CommandSink(AlertSink):
+    """Run a shell command per event with the event as JSON on stdin and ALERT_NAME/ALERT_STATE set."""
+
+    def __init__(self, command, timeout=10):
+        self.command = command
+        self.timeout = timeout
+
+    def send(self, event):
+        environment = dict(os.environ, ALERT_NAME=event['alert'], ALERT_STATE=event['state'])
+        subprocess.run(self.command, shell=True, input=json.dumps(event), text=True, env=environment,
+                       timeout=self.timeout, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+class WebhookSink(AlertSink):
+    """POST every event as JSON to a URL."""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, event):
+        import urllib.request
+        request = urllib.request.Request(self.url, data=json.dumps(event).encode(), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+def parse_alert_sink(text):
+    """Parse an --alert-sink argument: log:FILE, exec:COMMAND or an http(s):// webhook URL."""
+    kind, _, target = text.partition(':')
+    if kind in ('http', 'https'):
+        return WebhookSink(text)
+    if kind == 'log' and target:
+        return LogSink(target)
+    if kind == 'exec' and target:
+        return CommandSink(target)
+    raise argparse.ArgumentTypeError(f"expected log:FILE, exec:COMMAND or http://URL, got {text!r}")
+
+class AlertEngine:
+    """Evaluate alert rules against every snapshot and deliver state changes to sinks.
+
+    Every condition keeps its own WindowAggregate, so a tick costs a fixed
+    amount per condition. A series glob (gpu*.utilization) is resolved
+    against the series keys only when the set of keys changes; its value
+    is the largest matching value for > and >= and the smallest for < and
+    <=, so the condition holds when any matching series crosses. A rule
+    is pending while all its conditions hold and fires once they held for
+    its for-duration. A condition with a clear value keeps holding until
+    the series crosses back over it. Events are delivered in order on one
+    background thread so a slow webhook never delays a tick.
+    """
+
+    def __init__(self, rules, sinks=(), host=None):
+        self.rules = [dict(rule, state='inactive', since=None, conditions=[
+            dict(condition, aggregate=WindowAggregate(condition['function'], condition['seconds']),
+                 matches=None, holds=False, value=None)
+            for condition in rule['conditions']]) for rule in rules]
+        self.sinks = list(sinks)
+        self.host = host or socket.gethostname()
+        self.keys = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='alert') if self.sinks else None
+        self.error = None
+
+    def deliver(self, event):
+        for sink in self.sinks:
+            try:
+                sink.send(event)
+            except Exception as e:
+                self.error = f"{type(sink).__name__}: {e}"
+
+    def evaluate(self, snapshot):
+        """Update every rule with a snapshot and return their states."""
+        now = snapshot['time']
+        series = {key: value for key, value in snapshot_series(snapshot) if value is not None}
+        if series.keys() != self.keys:
+            self.keys = series.keys()
+            for rule in self.rules:
+                for condition in rule['conditions']:
+                    condition['matches'] = [key for key in series if fnmatch.fnmatchcase(key, condition['series'])]
+        states = []
+        for rule in self.rules:
+            for condition in rule['conditions']:
+                values = [series[key] for key in condition['matches'] if key in series]
+                if values:
+                    condition['aggregate'].update(now, (max if condition['op'][0] == '>' else min)(values))
+                value = condition['value'] = condition['aggregate'].value() if values else None
+                threshold = condition['threshold']
+                if condition['holds'] and condition['clear'] is not None:
+                    threshold = condition['clear']
+                condition['holds'] = value is not None and ALERT_OPERATORS[condition['op']](float(value), threshold)
+            previous = rule['state']
+            if all(condition['holds'] for condition in rule['conditions']):
+                rule['since'] = rule['since'] or now
+                rule['state'] = 'firing' if previous == 'firing' or now - rule['since'] >= rule['for'] else 'pending'
+            else:
+                rule['since'] = None
+                rule['state'] = 'inactive'
+            state = {'alert': rule['name'], 'state': rule['state'], 'since': rule['since'], 'rule': rule['text'],
+                     'values': {condition['text']: condition['value'] for condition in rule['conditions']}}
+            states.append(state)
+            if self.executor and rule['state'] != previous and 'firing' in (rule['state'], previous):
+                event = dict(state, state='firing' if rule['state'] == 'firing' else 'resolved',
+                             time=now, host=self.host)
+                self.executor.submit(self.deliver, event)
+        return states
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=True)  # deliver the last resolved events
+
+def build_alerts(args):
+    """Create the AlertEngine for --alert and --alert-rules, or None without rules."""
+    rules = args.alert + (read_alert_rules(args.alert_rules) if args.alert_rules else [])
+    if not rules:
+        return None
+    return AlertEngine(rules, args.alert_sink, args.name)
+
+def format_alert(alert):
+    """Return the display line of an alert state, with the current value of every condition."""
+    values = ', '.join(f"{text} [{value:.4g}]" if value is not None else text
+                       for text, value in alert['values'].items())
+    return f" ALERT {alert['alert']} {alert['state']}: {values}"
+
+class Scheduler:
+    """Run collectors concurrently on one tick clock.
+
+    Every tick submits each collector to a thread pool and waits until all of
+    them finish or the tick interval elapses, whichever comes first. A
+    collector still running at the deadline keeps its previous value and is
+    listed in the snapshot's ``stale`` entry, so one slow source never delays
+    the others. Collector latencies, tick overruns and the monitor's own CPU
+    and RSS are kept in stats and added to every snapshot as 'self', energy
+    per token as 'efficiency', the folded samples of collectors sampling
+    faster than the tick as 'fold' and, if an AlertEngine is given, its rule
+    states as 'alerts'.
+    """
+
+    def __init__(self, collectors, interval=1, alerts=None):
+        self.collectors = collectors
+        self.interval = interval
+        self.alerts = alerts
+        self.executor = ThreadPoolExecutor(max_workers=max(len(collectors), 1),
+                                           thread_name_prefix='collector')
+        self.pending = {}
+        self.last = {}
+        self.stats = SelfStats([collector.name for collector in collectors] + ['tick'])
+
+    def timed_collect(self, collector):
+        start = time.perf_counter()
+        try:
+            return collector.collect()
+        finally:
+            self.stats.record(collector.name, time.perf_counter() - start)
+
+    def tick(self, deadline):
+        """Collect one time-aligned snapshot, waiting until deadline at most."""
+        start = time.perf_counter()
+        snapshot = {'time': time.time(), 'stale': [], 'errors': {}}
+        for collector in self.collectors:
+            if collector.name not in self.pending:
+                self.pending[collector.name] = self.executor.submit(self.timed_collect, collector)
+
+        wait(list(self.pending.values()), timeout=max(deadline - time.monotonic(), 0))
+
+        for collector in self.collectors:
+            future = self.pending[collector.name]
+            if future.done():
+                del self.pending[collector.name]
+                try:
+                    self.last[collector.name] = future.result()
+                except Exception as e:
+                    self.last[collector.name] = None
+                    snapshot['errors'][collector.name] = str(e)
+            else:
+                snapshot['stale'].append(collector.name)
+            snapshot[collector.name] = self.last.get(collector.name)
+            fold = collector.fold()
+            if fold:
+                snapshot.setdefault('fold', {}).update(fold)
+        snapshot['efficiency'] = efficiency(snapshot)
+        self.stats.record('tick', time.perf_counter() - start)
+        snapshot['self'] = self.stats.summary()
+        if self.alerts:
+            start = time.perf_counter()
+            snapshot['alerts'] = self.alerts.evaluate(snapshot)
+            self.stats.record('alerts', time.perf_counter() - start)
+            if self.alerts.error:
+                snapshot['errors']['alerts'] = self.alerts.error
+        return snapshot
+
+    def run(self):
+        """Yield one snapshot per interval until the caller stops iterating."""
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.interval
+            yield self.tick(next_tick)
+            self.stats.ticks += 1
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.stats.overruns += 1
+                next_tick = time.monotonic()  # overran, realign the clock
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for collector in self.collectors:
+            collector.close()
+        if self.alerts:
+            self.alerts.close()
+
+def parse_sample_rate(text):
+    """Parse a --sample-rate NAME=SECONDS argument."""
+    name, _, period = text.partition('=')
     try:
-        result = subprocess.check_output(command, shell=True).decode().strip()
-    except subprocess.CalledProcessError:
+        period = float(period)
+    except ValueError:
+        period = 0
+    if name not in ('cpu', 'memory', 'gpu', 'nic') or period <= 0:
+        raise argparse.ArgumentTypeError(f"expected cpu|memory|gpu|nic=SECONDS, got {text!r}")
+    return name, period
+
+def build_collectors(args, sampler, sink=None):
+    """Create the collectors selected by the command line arguments.
+
+    Collectors named in --sample-rate run on their own thread at that
+    period; their rates are not smoothed so short bursts stay visible.
+    """
+    sample_rates = dict(args.sample_rate)
+
+    def rates(name):
+        return RateEngine('none' if name in sample_rates else args.smoothing, args.smoothing_window)
+
+    gpu_backend = open_gpu_backend(args.gpu_backend, min(args.interval, sample_rates.get('gpu', args.interval)))
+    collectors = [CpuCollector(sampler), MemoryCollector(sampler),
+                  GpuCollector(gpu_backend, rates('gpu')),
+                  NicCollector(rates('nic'), args.root, args.nic_include, ('lo', 'docker0') + tuple(args.nic_exclude)),
+                  NumaCollector(gpu_backend, rates('numa'), args.root)]
+    collectors = [FastCollector(collector, sample_rates[collector.name], sink)
+                  if collector.name in sample_rates else collector for collector in collectors]
+    targets = args.api_url + (read_targets(args.api_targets) if args.api_targets else [])
+    if args.processes:
+        collectors.append(ProcessCollector(gpu_backend, args.processes))
+    if args.cgroups:
+        collectors.append(CgroupCollector(rates('cgroup'), args.root))
+    if targets:
+        collectors.append(VllmCollector(targets, rates('vllm'), args.api_timeout, 0.8 * args.interval,
+                                        args.latency_window, args.slo))
+    return collectors
+
+def prom_escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prom_value(value):
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+def prom_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{prom_escape(value)}"' for name, value in labels) + '}'
+
+def prom_family(sample_name, types):
+    """Return the metric family a sample belongs to, or None if it has no TYPE line."""
+    if sample_name in types:
+        return sample_name
+    for suffix in ('_bucket', '_sum', '_count', '_total', '_created'):
+        if sample_name.endswith(suffix) and sample_name[:-len(suffix)] in types:
+            return sample_name[:-len(suffix)]
+    return None
+
+def render_exposition(snapshot, node_info):
+    """Render a snapshot in the Prometheus text exposition format."""
+    families = {}
+
+    def add(name, metric_type, help_text, labels, value):
+        if value is None:
+            return
+        family = families.setdefault(name, (metric_type, help_text, []))
+        family[2].append(f"{name}{prom_labels(labels)} {prom_value(value)}")
+
+    add('ai_monitor_node_info', 'gauge', 'Static host facts', sorted(node_info.items()), 1)
+    cpu = snapshot.get('cpu')
+    if cpu:
+        add('ai_monitor_cpu_utilization_percent', 'gauge', 'CPU utilization', (), cpu['average'])
+        for socket_id, usage in cpu['sockets'].items():
+            add('ai_monitor_cpu_socket_utilization_percent', 'gauge', 'CPU utilization per socket',
+                (('socket', socket_id),), usage)
+    memory = snapshot.get('memory')
+    if memory:
+        add('ai_monitor_memory_used_bytes', 'gauge', 'Used host memory', (), memory['used'])
+        add('ai_monitor_memory_total_bytes', 'gauge', 'Total host memory', (), memory['total'])
+    for gpu in snapshot.get('gpu') or []:
+        labels = (('gpu', gpu['index']), ('name', gpu['name']), ('uuid', gpu['uuid']))
+        add('ai_monitor_gpu_utilization_percent', 'gauge', 'GPU utilization', labels, gpu['utilization'])
+        for field in ('memory_used', 'memory_total'):
+            value = gpu[field] * 1024 ** 3 if gpu[field] is not None else None
+            add(f'ai_monitor_gpu_{field}_bytes', 'gauge', f'GPU {field.replace("_", " ")}', labels, value)
+        add('ai_monitor_gpu_power_watts', 'gauge', 'GPU power draw', labels, gpu['power'])
+        add('ai_monitor_gpu_power_limit_watts', 'gauge', 'GPU enforced power limit', labels, gpu['power_limit'])
+        add('ai_monitor_gpu_average_power_watts', 'gauge', 'GPU average power from the energy counter',
+            labels, gpu['energy_power'])
+        add('ai_monitor_gpu_energy_joules_total', 'counter', 'GPU energy used', labels, gpu['energy'])
+        add('ai_monitor_gpu_sm_clock_hertz', 'gauge', 'GPU SM clock', labels,
+            gpu['sm_clock'] * 1e6 if gpu['sm_clock'] is not None else None)
+        add('ai_monitor_gpu_memory_clock_hertz', 'gauge', 'GPU memory clock', labels,
+            gpu['memory_clock'] * 1e6 if gpu['memory_clock'] is not None else None)
+        add('ai_monitor_gpu_temperature_celsius', 'gauge', 'GPU temperature', labels, gpu['temperature'])
+        add('ai_monitor_gpu_throttle_reasons', 'gauge', 'Bitmask of active GPU clock throttle reasons',
+            labels, gpu['throttle'])
+        node = snapshot.get('efficiency') or {}
+        per_gpu = node.get('gpus', {}).get(gpu['index']) or {}
+        add('ai_monitor_gpu_joules_per_token', 'gauge',
+            "This GPU's share of the node's GPU energy per generated vLLM token", labels, per_gpu.get('joules_per_token'))
+    node = snapshot.get('efficiency')
+    if node:
+        add('ai_monitor_power_watts', 'gauge', 'Average power of all GPUs', (), node['power'])
+        add('ai_monitor_joules_per_token', 'gauge', 'GPU energy per generated vLLM token', (),
+            node['joules_per_token'])
+        add('ai_monitor_tokens_per_second_per_watt', 'gauge', 'vLLM generation throughput per GPU watt', (),
+            node['tokens_per_watt'])
+    cpu_nodes = (cpu or {}).get('nodes') or {}
+    for node, stats in (snapshot.get('numa') or {}).items():
+        labels = (('node', node),)
+        add('ai_monitor_numa_cpu_utilization_percent', 'gauge', 'CPU utilization per NUMA node',
+            labels, cpu_nodes.get(node))
+        add('ai_monitor_numa_memory_used_bytes', 'gauge', 'Used memory per NUMA node', labels, stats['memory_used'])
+        add('ai_monitor_numa_memory_total_bytes', 'gauge', 'Total memory per NUMA node', labels, stats['memory_total'])
+        add('ai_monitor_numa_allocation_bytes_per_second', 'gauge', 'Page allocation rate per NUMA node',
+            labels, stats['allocation_bps'])
+        add('ai_monitor_numa_remote_allocation_percent', 'gauge',
+            'Share of page allocations on a NUMA node made by CPUs of other nodes', labels, stats['remote_percent'])
+        for index in stats['gpus']:
+            add('ai_monitor_gpu_numa_node', 'gauge', 'NUMA node a GPU is attached to', (('gpu', index),), node)
+        for name in stats['nics']:
+            add('ai_monitor_nic_numa_node', 'gauge', 'NUMA node a NIC is attached to', (('interface', name),), node)
+    add('ai_monitor_numa_placement_warnings', 'gauge', 'Number of cross-NUMA placement warnings', (),
+        len(placement_warnings(snapshot)) if snapshot.get('numa') else None)
+    for name, (sent_bps, recv_bps) in (snapshot.get('nic') or {}).items():
+        add('ai_monitor_nic_transmit_bits_per_second', 'gauge', 'NIC transmit rate', (('interface', name),), sent_bps)
+        add('ai_monitor_nic_receive_bits_per_second', 'gauge', 'NIC receive rate', (('interface', name),), recv_bps)
+
+    for cgroup in snapshot.get('cgroup') or []:
+        labels = (('cgroup', cgroup['path']), ('name', cgroup['name']), ('kind', cgroup['kind']))
+        if cgroup['kind'] == 'container':  # slices include their containers, the slice label tells which
+            labels += (('slice', cgroup['slice'] or ''),)
+        add('ai_monitor_cgroup_cpu_percent', 'gauge', 'CPU used by a cgroup in percent of one core',
+            labels, cgroup['cpu'])
+        add('ai_monitor_cgroup_cpu_limit_cores', 'gauge', 'CPU quota of a cgroup', labels, cgroup['cpu_limit'])
+        add('ai_monitor_cgroup_throttled_percent', 'gauge', 'Share of CFS periods a cgroup was throttled in',
+            labels, cgroup['throttled'])
+        add('ai_monitor_cgroup_memory_bytes', 'gauge', 'Memory charged to a cgroup', labels, cgroup['memory'])
+        add('ai_monitor_cgroup_memory_limit_bytes', 'gauge', 'Memory limit of a cgroup', labels, cgroup['memory_limit'])
+        add('ai_monitor_cgroup_read_bytes_per_second', 'gauge', 'Block IO read rate of a cgroup',
+            labels, cgroup['read_bps'])
+        add('ai_monitor_cgroup_write_bytes_per_second', 'gauge', 'Block IO write rate of a cgroup',
+            labels, cgroup['write_bps'])
+        if cgroup['net']:
+            add('ai_monitor_cgroup_transmit_bits_per_second', 'gauge', "Transmit rate of a container's network namespace",
+                labels, cgroup['net'][0])
+            add('ai_monitor_cgroup_receive_bits_per_second', 'gauge', "Receive rate of a container's network namespace",
+                labels, cgroup['net'][1])
+    processes = snapshot.get('process') or {'gpus': {}, 'servers': []}
+    for index, top in processes['gpus'].items():
+        for process in top:
+            labels = (('gpu', index), ('pid', process['pid']), ('name', process['name'] or ''),
+                      ('server', process['server']['name'] if process['server'] else ''))
+            add('ai_monitor_process_gpu_memory_bytes', 'gauge', 'GPU memory of the top processes per GPU', labels,
+                process['gpu_memory'] * 1024 ** 3 if process['gpu_memory'] is not None else None)
+            add('ai_monitor_process_cpu_percent', 'gauge', 'CPU used by the top processes per GPU',
+                labels, process['cpu'])
+            add('ai_monitor_process_resident_memory_bytes', 'gauge', 'RSS of the top processes per GPU',
+                labels, process['rss'])
+    for server in processes['servers']:
+        labels = (('server', server['name']), ('pid', server['pid']))
+        add('ai_monitor_vllm_server_gpu_memory_bytes', 'gauge', 'GPU memory of a vLLM server and its workers',
+            labels, server['gpu_memory'] * 1024 ** 3)
+        add('ai_monitor_vllm_server_cpu_percent', 'gauge', 'CPU used by a vLLM server and its workers',
+            labels, server['cpu'])
+        add('ai_monitor_vllm_server_resident_memory_bytes', 'gauge', 'RSS of a vLLM server and its workers',
+            labels, server['rss'])
+
+    for endpoint in (snapshot.get('vllm') or {}).get('endpoints') or []:
+        labels = (('endpoint', endpoint['name']),)
+        add('ai_monitor_vllm_up', 'gauge', 'Whether the vLLM metrics endpoint answered', labels, int(endpoint['up']))
+        for model, summary in endpoint['models'].items():
+            model_labels = labels + ((('model_name', model),) if model is not None else ())
+            add('ai_monitor_vllm_generation_tokens_per_second', 'gauge', 'vLLM generation throughput',
+                model_labels, summary['throughput'])
+            add('ai_monitor_vllm_prompt_tokens_per_second', 'gauge', 'vLLM prompt processing rate',
+                model_labels, summary['prompt_tokens_per_s'])
+            for name, latency in summary['latency'].items():
+                for quantile, q in LATENCY_QUANTILES:
+                    add('ai_monitor_vllm_latency_seconds', 'gauge', 'vLLM request latency quantiles over the window',
+                        model_labels + (('metric', name), ('quantile', q)), latency[quantile])
+    for slo in (snapshot.get('vllm') or {}).get('slo') or []:
+        add('ai_monitor_vllm_slo_violated', 'gauge', 'Whether a configured latency SLO is violated',
+            (('metric', slo['metric']), ('quantile', dict(LATENCY_QUANTILES)[slo['quantile']])), int(slo['violated']))
+
+    for alert in snapshot.get('alerts') or []:
+        add('ai_monitor_alert_firing', 'gauge', 'Whether an alert rule is firing', (('alert', alert['alert']),),
+            int(alert['state'] == 'firing'))
+
+    stats = snapshot.get('self')
+    if stats:
+        add('ai_monitor_self_ticks_total', 'counter', 'Collection ticks run', (), stats['ticks'])
+        add('ai_monitor_self_tick_overruns_total', 'counter', 'Ticks that took longer than the interval',
+            (), stats['overruns'])
+        add('ai_monitor_self_cpu_percent', 'gauge', 'CPU used by the monitor itself', (), stats['cpu'])
+        add('ai_monitor_self_resident_memory_bytes', 'gauge', 'RSS of the monitor itself', (), stats['rss'])
+        for phase, latency in stats['latency'].items():
+            name = 'ai_monitor_self_phase_latency_seconds'
+            for quantile, key in (('0.5', 'p50'), ('0.99', 'p99')):
+                add(name, 'summary', 'Latency of each collector and of the tick and render phases',
+                    (('phase', phase), ('quantile', quantile)), latency[key])
+            add(f"{name}_sum", 'summary', '', (('phase', phase),), latency['sum'])
+            add(f"{name}_count", 'summary', '', (('phase', phase),), latency['count'])
+
+    lines = []
+    for name, (metric_type, help_text, samples) in families.items():
+        if help_text:  # _sum and _count samples belong to the family above them
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(samples)
+
+    # Re-export the scraped vllm:* samples with an endpoint label, grouped by family
+    # so endpoints serving the same metric share one TYPE line
+    exported = {}
+    for endpoint in (snapshot.get('vllm') or {}).get('endpoints') or []:
+        metrics = endpoint['metrics']
+        if metrics is None:
+            continue
+        for sample_name, series in metrics.samples.items():
+            family = prom_family(sample_name, metrics.types)
+            type_line = f"# TYPE {family} {metrics.types[family]}" if family is not None else None
+            samples = exported.setdefault(family or sample_name, (type_line, []))[1]
+            for labels, value in series.items():
+                labels = (('endpoint', endpoint['name']),) + labels
+                samples.append(f"{sample_name}{prom_labels(labels)} {prom_value(value)}")
+    for type_line, samples in exported.values():
+        if type_line:
+            lines.append(type_line)
+        lines.extend(samples)
+    lines.append('')
+    return '\n'.join(lines)
+
+class MetricsCache:
+    """The latest pre-rendered exposition, plain and gzip-compressed."""
+
+    def __init__(self):
+        import gzip
+        self.body = b''
+        self.gzipped = gzip.compress(b'')
+
+    def update(self, text):
+        import gzip
+        body = text.encode('utf-8')
+        # Swap both attributes together so a handler never pairs old and new bodies
+        self.body, self.gzipped = body, gzip.compress(body, compresslevel=1)
+
+def metrics_handler():
+    """Return the /metrics request handler class; http.server is only imported in exporter mode."""
+    import http.server
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        """Serve /metrics from the MetricsCache without touching any collector."""
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            cache = self.server.cache
+            body, gzipped = cache.body, cache.gzipped
+            use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+            payload = gzipped if use_gzip else body
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            if use_gzip:
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+def parse_listen_address(address):
+    """Split ':PORT' or 'HOST:PORT' into (host, port)."""
+    host, _, port = address.rpartition(':')
+    return host, int(port)
+
+INVENTORY_VERSION = 2
+
+def default_inventory_path():
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache, 'ai-monitor', 'inventory.json')
+
+def physical_nics(root='/'):
+    """Names of the interfaces backed by a device; veth, bridge and other virtual links have none."""
+    net = os.path.join(root, 'sys', 'class', 'net')
+    try:
+        return sorted(name for name in os.listdir(net) if os.path.exists(os.path.join(net, name, 'device')))
+    except OSError:
         return []
-    
-    gpu_info = []
-    for line in result.split('\n'):
-        gpu_name, memory_used, gpu_utilization, gpu_memory = line.split(", ")
-        memory_used = int(memory_used) / 1024
-        gpu_memory = int(gpu_memory) / 1024
-        gpu_utilization = int(gpu_utilization)
-        gpu_info.append((gpu_name, memory_used, gpu_utilization, gpu_memory))
-    
-    return gpu_info
-
-def get_memory_info():
-    command = "free -h | awk '/^Mem:/ {print $2, $3, $4}'"
-    result = subprocess.check_output(command, shell=True).decode().strip()
-    total, used, available = result.split()
-    return total, used, available
-
-def get_generation_throughput(api_url):
-    """Retrieve the average generation throughput from the vLLM API."""
-    try:
-        response = requests.get(api_url)
-        response.raise_for_status()  # Raise an error for bad status codes
-
-        # Extract the specific metric from the Prometheus text response
-        pattern = r'^vllm:avg_generation_throughput_toks_per_s{.*}\s+([\d\.]+)'
-        match = re.search(pattern, response.text, re.MULTILINE)
-        if match:
-            return float(match.group(1))
+
+def hardware_fingerprint(root='/'):
+    """Digest of the DMI product, CPU, PCI device and physical NIC lists under root; cheap to compute.
+
+    Virtual interfaces are left out so container churn does not invalidate the cache.
+    """
+    digest = hashlib.sha256(os.path.abspath(root).encode())
+    digest.update(get_server_type(root).encode())
+    for parts in (('sys', 'devices', 'system', 'cpu'), ('sys', 'bus', 'pci', 'devices')):
+        try:
+            entries = sorted(os.listdir(os.path.join(root, *parts)))
+        except OSError:
+            entries = []
+        digest.update('\0'.join(entries).encode() + b'\n')
+    digest.update('\0'.join(physical_nics(root)).encode())
+    return digest.hexdigest()
+
+class Inventory:
+    """Static host facts, cached on disk between runs.
+
+    The cache is keyed by the kernel boot ID and a hardware fingerprint, so
+    it is rebuilt after a reboot or when CPUs, PCI devices (GPUs) or physical
+    NICs change. Without a boot ID (e.g. a fake --root) nothing is cached. GPU
+    names are only known once the GPU backend reports; update_gpus() stores
+    them so the next start can draw the GPU header before the first sample.
+    """
+
+    def __init__(self, sampler, root='/', path=None):
+        self.sampler = sampler
+        self.root = root
+        self.path = path
+        try:
+            boot_id = read_file(os.path.join(root, 'proc', 'sys', 'kernel', 'random', 'boot_id'))
+        except OSError:
+            boot_id = self.path = None
+        self.key = {'version': INVENTORY_VERSION, 'boot_id': boot_id,
+                    'fingerprint': hardware_fingerprint(root) if self.path else None}
+        self.facts = self.load()
+        if self.facts is None:
+            self.facts = self.collect()
+            self.save()
         else:
-            return "N/A [API down]"  # Return "N/A" if metric not found
+            topology = dict(self.facts['topology'])
+            topology['core_socket'] = {int(cpu): socket_id for cpu, socket_id in topology['core_socket'].items()}
+            topology['core_node'] = {int(cpu): node for cpu, node in topology['core_node'].items()}
+            self.sampler._topology = topology
+
+    def load(self):
+        if not self.path:
+            return None
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cached.get('facts') if cached.get('key') == self.key else None
+
+    def collect(self):
+        return {'server': get_server_type(self.root), 'topology': self.sampler.topology(), 'gpus': []}
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temporary = f"{self.path}.{os.getpid()}"
+            with open(temporary, 'w') as f:
+                json.dump({'key': self.key, 'facts': self.facts}, f)
+            os.replace(temporary, self.path)
+        except OSError:
+            pass  # read-only home directory, run without a cache
+
+    def update_gpus(self, gpus):
+        names = [gpu['name'] for gpu in gpus]
+        if names != self.facts['gpus']:
+            self.facts['gpus'] = names
+            self.save()
+
+    def node_info(self):
+        """Static host facts shown in the header and exported as labels."""
+        topology = self.facts['topology']
+        return {
+            'hostname': socket.gethostname(),
+            'server': self.facts['server'],
+            'cpu_model': topology['model'],
+            'sockets': topology['sockets'],
+            'cores_per_socket': topology['cores_per_socket'],
+        }
+
+def get_node_info(sampler, root='/', path=None):
+    """Static host facts, from the inventory cache at path when it is still valid."""
+    return Inventory(sampler, root, path).node_info()
+
+OUTPUT_SCHEMA = 1
+
+def output_record(snapshot, host):
+    """Return the --format jsonl record of a snapshot; 'metrics' holds the flattened series."""
+    return {
+        'schema': OUTPUT_SCHEMA,
+        'time': round(snapshot['time'], 3),
+        'host': host,
+        'stale': snapshot['stale'],
+        'errors': snapshot['errors'],
+        'alerts': [alert['alert'] for alert in snapshot.get('alerts') or [] if alert['state'] == 'firing'],
+        'metrics': {key: value for key, value in snapshot_series(snapshot) if value is not None},
+    }
+
+def write_output(args):
+    """Headless output: write one record per tick as JSON Lines or CSV to --output or stdout.
+
+    JSON Lines records follow output_record(). CSV is written in long form
+    (time, host, metric, value) so its header never changes when GPUs,
+    NICs or models come and go. Records are buffered and written in one
+    batch every --flush-interval seconds. The first tick only primes the
+    rate counters and is not written.
+    """
+    import io
+    scheduler = Scheduler(build_collectors(args, ProcSampler(args.root)), args.interval, build_alerts(args))
+    host = args.name or socket.gethostname()
+    count = 1 if args.once else args.count
+    out = open(args.output, 'a') if args.output else sys.stdout
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if args.format == 'csv' and not (args.output and out.tell()):
+        writer.writerow(('time', 'host', 'metric', 'value'))
+
+    def flush():
+        out.write(buffer.getvalue())
+        out.flush()
+        buffer.seek(0)
+        buffer.truncate()
+
+    written = 0
+    last_flush = time.monotonic()
+    try:
+        for ticks, snapshot in enumerate(scheduler.run()):
+            if ticks == 0:
+                continue
+            record = output_record(snapshot, host)
+            if args.format == 'jsonl':
+                buffer.write(json.dumps(record, separators=(',', ':')) + '\n')
+            else:
+                writer.writerows((record['time'], host, key, value) for key, value in record['metrics'].items())
+            written += 1
+            if count is not None and written >= count:
+                break
+            if time.monotonic() - last_flush >= args.flush_interval:
+                flush()
+                last_flush = time.monotonic()
+        flush()
+    except KeyboardInterrupt:
+        flush()
+    except BrokenPipeError:
+        sys.stderr.close()  # the reader went away (e.g. | head), exit quietly
+    finally:
+        scheduler.close()
+        if args.output:
+            out.close()
+
+def serve(args):
+    """Headless exporter: run the collectors and serve /metrics over HTTP."""
+    sampler = ProcSampler(args.root)
+    node_info = get_node_info(sampler, args.root, args.inventory_cache)
+    scheduler = Scheduler(build_collectors(args, sampler), args.interval, build_alerts(args))
+
+    import http.server
+    host, port = parse_listen_address(args.serve)
+    server = http.server.ThreadingHTTPServer((host, port), metrics_handler())
+    server.daemon_threads = True
+    server.cache = MetricsCache()
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    print(f"Serving metrics on http://{host or '0.0.0.0'}:{port}/metrics", file=sys.stderr)
+
+    try:
+        for snapshot in scheduler.run():
+            server.cache.update(render_exposition(snapshot, node_info))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()  # the serving thread is a daemon and exits with us
+        scheduler.close()
 
-    except requests.RequestException:
-        return "N/A [API down]"  # Suppress error messages and return "N/A" if the API is down
+def burst(args):
+    """Write every raw sample of the --sample-rate collectors as JSON lines for args.burst seconds."""
+    if not args.sample_rate:
+        args.sample_rate = [('gpu', 0.05), ('nic', 0.05)]
+    lock = threading.Lock()
 
-def main(stdscr, api_url):
+    def sink(timestamp, name, series):
+        line = json.dumps(dict(series, time=timestamp, collector=name))
+        with lock:
+            sys.stdout.write(line + '\n')
+
+    collectors = build_collectors(args, ProcSampler(args.root), sink)
+    try:
+        time.sleep(args.burst)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for collector in collectors:
+            collector.close()
+        sys.stdout.flush()
+
+RECORD_MAGIC = b'AIMONREC'
+RECORD_VERSION = 1
+RECORD_HEADER = struct.Struct('<8sHIIdII')  # magic, version, slots, stride, interval, index count, schema length
+RECORD_HEADER_SIZE = 65536
+RECORD_SCHEMA_OFFSET = 64
+RECORD_INDEX_OFFSET = 32768
+RECORD_INDEX_CAPACITY = (RECORD_HEADER_SIZE - RECORD_INDEX_OFFSET) // 8
+RECORD_META_RESERVE = 4096  # schema room kept for node facts that arrive later (GPU names)
+REPLAY_CGROUPS = 10  # cgroup rows shown when replaying without --cgroups
+RECORD_SLOT_ORDER = {'nic': 1, 'process': 2, 'cgroup': 2}  # series families that take free slots last
+
+class Recorder:
+    """Append every tick's snapshot to a binary session log.
+
+    The file starts with a 64 KiB header holding the format fields, a JSON
+    schema (series key per slot plus node facts) and a periodic index: the
+    timestamp of every stride-th record. When the index is full every other
+    entry is dropped and the stride doubles, so it covers recordings of any
+    length. Fixed-width records follow the header, each a float64 timestamp
+    and one float32 per slot (NaN when the series had no value). Series that
+    first appear mid-recording take the next free slot and the header is
+    rewritten in place.
+
+    Unless slots is given, the record width is sized from the first
+    snapshot with room for twice as many series. Series that still find no
+    free slot, or no room in the schema, are not recorded and counted in
+    dropped; warning describes them for the status line.
+    """
+
+    def __init__(self, path, meta, interval, slots=None):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.meta = dict(meta, gpus={}, processes={})
+        self.interval = interval
+        self.slots = slots or 0
+        self.record = struct.Struct(f'<d{self.slots}f')
+        self.keys = []
+        self.columns = {}
+        self.schema_size = len(json.dumps({'keys': [], 'meta': self.meta})) + RECORD_META_RESERVE
+        self.dropped = set()
+        self.warning = None
+        self.count = 0
+        self.stride = 64
+        self.index = array.array('d')
+        os.ftruncate(self.fd, RECORD_HEADER_SIZE)
+        self.write_header()
+
+    def write_header(self):
+        schema = json.dumps({'keys': self.keys, 'meta': self.meta}).encode()
+        if RECORD_SCHEMA_OFFSET + len(schema) > RECORD_INDEX_OFFSET:
+            raise ValueError("recording schema does not fit in the header")
+        header = RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, self.slots, self.stride,
+                                    self.interval, len(self.index), len(schema))
+        os.pwrite(self.fd, header, 0)
+        os.pwrite(self.fd, schema, RECORD_SCHEMA_OFFSET)
+        os.pwrite(self.fd, self.index.tobytes(), RECORD_INDEX_OFFSET)
+
+    def append(self, snapshot):
+        header_changed = False
+        series = [(key, value) for key, value in snapshot_series(snapshot) if value is not None]
+        if not self.slots:
+            # Twice the first snapshot's series, but no more than their keys can name in the schema
+            key_size = sum(len(json.dumps(key)) + 2 for key, _ in series) / max(len(series), 1)
+            fit = int((RECORD_INDEX_OFFSET - RECORD_SCHEMA_OFFSET - self.schema_size) / max(key_size, 8))
+            self.slots = max(256, min(-(-2 * len(series) // 64) * 64, fit))
+            self.record = struct.Struct(f'<d{self.slots}f')
+        # New series take free slots with per-interface NIC series, then per
+        # process and per cgroup series last, so a host with many veths or
+        # containers runs out on those rather than on vLLM's
+        new = [key for key, _ in series if key not in self.columns and key not in self.dropped]
+        for key in sorted(new, key=lambda key: RECORD_SLOT_ORDER.get(key.split('.', 1)[0], 0)):
+            size = len(json.dumps(key)) + 2
+            if len(self.keys) == self.slots or RECORD_SCHEMA_OFFSET + self.schema_size + size > RECORD_INDEX_OFFSET:
+                self.dropped.add(key)
+                self.warning = f"recording is out of slots, {len(self.dropped)} series not recorded"
+                continue
+            self.columns[key] = len(self.keys)
+            self.keys.append(key)
+            self.schema_size += size
+            header_changed = True
+        values = [math.nan] * self.slots
+        for key, value in series:
+            column = self.columns.get(key)
+            if column is not None:
+                values[column] = value
+        for gpu in snapshot.get('gpu') or []:
+            if str(gpu['index']) not in self.meta['gpus']:
+                self.meta['gpus'][str(gpu['index'])] = gpu['name']
+                header_changed = True
+        for top in ((snapshot.get('process') or {}).get('gpus') or {}).values():
+            for process in top:
+                pid, command = str(process['pid']), (process['command'] or '?')[:40]
+                size = len(json.dumps([pid, command])) + 2
+                if pid in self.meta['processes'] or f"process.{pid}.gpu_memory" not in self.columns \
+                        or RECORD_SCHEMA_OFFSET + self.schema_size + size > RECORD_INDEX_OFFSET:
+                    continue
+                self.meta['processes'][pid] = command
+                self.schema_size += size
+                header_changed = True
+        if 'vllm' in snapshot and not self.meta.get('vllm'):
+            self.meta['vllm'] = header_changed = True
+
+        offset = RECORD_HEADER_SIZE + self.count * self.record.size
+        os.pwrite(self.fd, self.record.pack(snapshot['time'], *values), offset)
+        if self.count % self.stride == 0:
+            if len(self.index) == RECORD_INDEX_CAPACITY:
+                self.index = self.index[::2]
+                self.stride *= 2
+            if self.count % self.stride == 0:
+                self.index.append(snapshot['time'])
+                header_changed = True
+        self.count += 1
+        if header_changed:
+            self.write_header()
+
+    def close(self):
+        os.close(self.fd)
+
+def series_snapshot(timestamp, series, meta):
+    """Rebuild a snapshot dict, as the collectors produce it, from flattened series."""
+    snapshot = {'time': timestamp, 'stale': [], 'errors': {}, 'cpu': None, 'memory': None}
+    if 'cpu' in series:
+        snapshot['cpu'] = {'average': series['cpu'], 'cores': {}, 'sockets': {}}
+    if 'memory.used' in series:
+        total = series.get('memory.total', 0)
+        snapshot['memory'] = {'used': series['memory.used'], 'total': total,
+                              'available': total - series['memory.used']}
+    gpus = {}
+    nics = {}
+    vllm = {}
+    cgroups = {}
+    processes = {}
+    for key, value in series.items():
+        if key.startswith('cpu.socket') and snapshot['cpu'] is not None:
+            snapshot['cpu']['sockets'][int(key[len('cpu.socket'):])] = value
+        elif key.startswith('gpu'):
+            index, field = key[3:].split('.', 1)
+            gpus.setdefault(int(index), {})[field] = value
+        elif key.startswith('nic.'):
+            name, direction = key[4:].rsplit('.', 1)
+            nics.setdefault(name, [0.0, 0.0])[direction == 'rx'] = value
+        elif key.startswith('vllm.'):
+            vllm[key[5:]] = value
+        elif key.startswith('cgroup.'):
+            name, field = key[7:].rsplit('.', 1)
+            cgroups.setdefault(name, {})[field] = value
+        elif key.startswith('process.'):
+            pid, field = key[8:].split('.', 1)
+            processes.setdefault(int(pid), {})[field] = value
+        elif key.startswith('efficiency.'):
+            snapshot.setdefault('efficiency', {'power': None, 'joules_per_token': None, 'tokens_per_watt': None,
+                                               'gpus': {}})[key[len('efficiency.'):]] = value
+    snapshot['gpu'] = []
+    for index in sorted(gpus):
+        gpu = {'index': index, 'uuid': None, 'name': meta.get('gpus', {}).get(str(index), 'GPU'),
+               'utilization': None, 'memory_used': None, 'memory_total': None,
+               'energy': None, 'energy_power': None, 'power': None, 'power_limit': None,
+               'sm_clock': None, 'memory_clock': None, 'temperature': None, 'throttle': None}
+        gpu.update(gpus[index])
+        snapshot['gpu'].append(gpu)
+    snapshot['nic'] = {name: tuple(rates) for name, rates in sorted(nics.items())}
+    if cgroups:
+        # Limits, container counts and namespaces are not recorded
+        snapshot['cgroup'] = sorted((
+            {'path': name, 'name': name, 'kind': 'slice' if name.endswith('.slice') else 'container',
+             'cpu': stats.get('cpu'), 'cpu_limit': None, 'throttled': stats.get('throttled'),
+             'memory': stats.get('memory', 0), 'memory_limit': None,
+             'read_bps': stats.get('read_bps'), 'write_bps': stats.get('write_bps'),
+             'net': (stats['tx'], stats.get('rx', 0.0)) if 'tx' in stats else None,
+             'netns': 'tx' in stats, 'slice': None}
+            for name, stats in cgroups.items()), key=lambda cgroup: cgroup['cpu'] or 0.0, reverse=True)
+    if processes:
+        gpus = {}
+        for pid, stats in sorted(processes.items(), key=lambda item: item[1].get('gpu_memory') or 0.0, reverse=True):
+            index = int(stats['gpu']) if 'gpu' in stats else None
+            gpus.setdefault(index, []).append({
+                'pid': pid, 'name': None, 'command': meta.get('processes', {}).get(str(pid)), 'server': None,
+                'status': None, 'gpu': index, 'gpu_memory': stats.get('gpu_memory'),
+                'cpu': stats.get('cpu'), 'rss': stats.get('rss')})
+        snapshot['process'] = {'gpus': dict(sorted(gpus.items(), key=lambda item: (item[0] is None, item[0] or 0))),
+                               'servers': []}
+    if meta.get('vllm'):
+        snapshot['vllm'] = {'up': bool(vllm)}
+        for field in ('throughput', 'prompt_tokens_per_s', 'running', 'waiting', 'kv_cache'):
+            snapshot['vllm'][field] = vllm.get(field)
+        snapshot['vllm']['latency'] = {}
+        for name, _ in LATENCY_HISTOGRAMS:
+            if f"{name}_p50" in vllm:
+                snapshot['vllm']['latency'][name] = {quantile: vllm.get(f"{name}_{quantile}")
+                                                     for quantile, _ in LATENCY_QUANTILES}
+    return snapshot
+
+class Replay:
+    """Memory-mapped reader for a Recorder session log.
+
+    Only the header, the pages around the seek position and the records
+    actually replayed are touched, so opening and seeking in a multi-day
+    recording is instant.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        import mmap
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.slots, self.stride, self.interval, index_count, schema_length = \
+            RECORD_HEADER.unpack_from(self.map, 0)
+        if magic != RECORD_MAGIC or version != RECORD_VERSION:
+            raise ValueError(f"{path} is not an ai-monitor recording")
+        schema = json.loads(self.map[RECORD_SCHEMA_OFFSET:RECORD_SCHEMA_OFFSET + schema_length])
+        self.keys = schema['keys']
+        self.meta = schema['meta']
+        self.index = array.array('d', self.map[RECORD_INDEX_OFFSET:RECORD_INDEX_OFFSET + 8 * index_count])
+        self.record = struct.Struct(f'<d{self.slots}f')
+
+    def __len__(self):
+        return (len(self.map) - RECORD_HEADER_SIZE) // self.record.size
+
+    def time_at(self, n):
+        return struct.unpack_from('<d', self.map, RECORD_HEADER_SIZE + n * self.record.size)[0]
+
+    def find(self, timestamp):
+        """Return the number of the first record at or after timestamp."""
+        # Binary search the periodic index, then the records of one stride
+        low, high = 0, len(self.index)
+        while low < high:
+            mid = (low + high) // 2
+            if self.index[mid] < timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        low = max(low - 1, 0) * self.stride
+        high = min(low + self.stride + 1, len(self))
+        while low < high:
+            mid = (low + high) // 2
+            if self.time_at(mid) < timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def snapshot(self, n):
+        timestamp, *values = self.record.unpack_from(self.map, RECORD_HEADER_SIZE + n * self.record.size)
+        series = {key: value for key, value in zip(self.keys, values) if not math.isnan(value)}
+        return series_snapshot(timestamp, series, self.meta)
+
+    def run(self, speed=1, seek=0):
+        """Yield snapshots from seek seconds into the recording (negative: from the end), paced by speed."""
+        if not len(self):
+            return
+        start = self.time_at(0) if seek >= 0 else self.time_at(len(self) - 1)
+        n = self.find(start + seek)
+        if n >= len(self):
+            return
+        wall_start, recorded_start = time.monotonic(), self.time_at(n)
+        for n in range(n, len(self)):
+            delay = (self.time_at(n) - recorded_start) / speed - (time.monotonic() - wall_start)
+            if delay > 0:
+                time.sleep(delay)
+            yield self.snapshot(n)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+def delta_encode(previous, current):
+    """Return (changed, removed): series whose value differs from previous, and keys that went away."""
+    changed = {key: value for key, value in current.items() if previous.get(key) != value}
+    removed = [key for key in previous if key not in current]
+    return changed, removed
+
+class AgentConnection:
+    """Persistent TCP connection from a node agent to the aggregator.
+
+    Messages are JSON lines. After connecting the agent sends a hello line
+    with its name, then one line per tick carrying only the series that
+    changed since the previous line. A failed send drops the connection and
+    the next send after retry seconds reconnects and resends the full state.
+    """
+
+    def __init__(self, address, name, retry=5):
+        self.address = address
+        self.name = name
+        self.retry = retry
+        self.sock = None
+        self.last_attempt = None
+        self.sent = {}
+
+    def connect(self):
+        now = time.monotonic()
+        if self.last_attempt is not None and now - self.last_attempt < self.retry:
+            return False
+        self.last_attempt = now
+        try:
+            self.sock = socket.create_connection(self.address, timeout=1)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.write({'hello': self.name})
+        except OSError:
+            self.close()
+            return False
+        self.sent = {}
+        return True
+
+    def write(self, message):
+        self.sock.sendall(json.dumps(message, separators=(',', ':')).encode() + b'\n')
+
+    def send(self, timestamp, series):
+        if self.sock is None and not self.connect():
+            return False
+        changed, removed = delta_encode(self.sent, series)
+        message = {'t': timestamp, 'd': changed}
+        if removed:
+            message['x'] = removed
+        try:
+            self.write(message)
+        except OSError:
+            self.close()
+            return False
+        self.sent = series
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+def compact_series(snapshot):
+    """Flatten a snapshot for the wire, rounding values so unchanged readings delta away."""
+    return {key: round(value, 2) for key, value in snapshot_series(snapshot) if value is not None}
+
+def run_agent(scheduler, connection):
+    """Push one delta-encoded sample per tick to the aggregator."""
+    try:
+        for snapshot in scheduler.run():
+            connection.send(snapshot['time'], compact_series(snapshot))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connection.close()
+        scheduler.close()
+
+def agent(args):
+    """Headless node agent: run the collectors and stream samples to --agent HOST:PORT."""
+    sampler = ProcSampler(args.root)
+    scheduler = Scheduler(build_collectors(args, sampler), args.interval, build_alerts(args))
+    connection = AgentConnection(parse_listen_address(args.agent), args.name or socket.gethostname())
+    run_agent(scheduler, connection)
+
+class HostState:
+    def __init__(self, name):
+        self.name = name
+        self.series = {}
+        self.last_seen = time.monotonic()
+        self.connected = True
+        self.generation = 0
+
+    def summary(self):
+        """Reduce the host's series to one table row of numbers."""
+        gpu_util = []
+        gpu_memory = 0.0
+        nic_tx = nic_rx = 0.0
+        for key, value in self.series.items():
+            if key.startswith('gpu'):
+                if key.endswith('.utilization'):
+                    gpu_util.append(value)
+                elif key.endswith('.memory_used'):
+                    gpu_memory += value
+            elif key.startswith('nic.'):
+                if key.endswith('.tx'):
+                    nic_tx += value
+                else:
+                    nic_rx += value
+        return {
+            'cpu': self.series.get('cpu'),
+            'gpus': len(gpu_util),
+            'gpu_util': sum(gpu_util) / len(gpu_util) if gpu_util else None,
+            'gpu_memory': gpu_memory,
+            'nic_tx': nic_tx,
+            'nic_rx': nic_rx,
+            'tokens': self.series.get('vllm.throughput'),
+        }
+
+class Aggregator:
+    """Fan in agent connections and keep the latest series of every host.
+
+    A host is stale when it has sent nothing for stale_after seconds and is
+    forgotten once it has been disconnected for forget_after seconds. An
+    agent reconnecting under the same name takes over its previous row: the
+    last-known series stay until its first full update replaces them, and
+    only the newest connection of a host may mark it down.
+    """
+
+    def __init__(self, stale_after=3, forget_after=300):
+        self.stale_after = stale_after
+        self.forget_after = forget_after
+        self.hosts = {}
+
+    async def handle(self, reader, writer):
+        host = generation = None
+        try:
+            hello = json.loads(await reader.readline())
+            name = str(hello['hello'])
+            host = self.hosts.get(name) or HostState(name)
+            self.hosts[name] = host
+            host.generation += 1
+            generation = host.generation
+            host.connected = True
+            first = True
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if generation != host.generation:
+                    continue  # superseded by a newer connection, drain until it closes
+                if first:
+                    host.series = {}  # the first message after hello carries the full state
+                    first = False
+                host.series.update(message['d'])
+                for key in message.get('x', ()):
+                    host.series.pop(key, None)
+                host.last_seen = time.monotonic()
+        except (ValueError, KeyError, TypeError, OSError):
+            pass  # malformed agent or reset connection, drop it
+        finally:
+            if host is not None and generation == host.generation:
+                host.connected = False
+                host.last_seen = time.monotonic()
+            writer.close()
+
+    def status(self, host, now):
+        if not host.connected:
+            return 'down'
+        return 'stale' if now - host.last_seen > self.stale_after else 'ok'
+
+    def rows(self):
+        """Return [(name, status, summary)] sorted by host name, forgetting long-gone hosts."""
+        now = time.monotonic()
+        for name in [name for name, host in self.hosts.items()
+                     if not host.connected and now - host.last_seen > self.forget_after]:
+            del self.hosts[name]
+        return [(name, self.status(host, now), host.summary())
+                for name, host in sorted(self.hosts.items())]
+
+def cluster_totals(rows):
+    """Sum NIC and tokens/s and average GPU utilization over the hosts that are up."""
+    live = [summary for _, status, summary in rows if status == 'ok']
+    gpus = sum(summary['gpus'] for summary in live)
+    gpu_util = sum((summary['gpu_util'] or 0) * summary['gpus'] for summary in live)
+    return {
+        'hosts': len(live),
+        'gpus': gpus,
+        'gpu_util': gpu_util / gpus if gpus else None,
+        'gpu_memory': sum(summary['gpu_memory'] for summary in live),
+        'nic_tx': sum(summary['nic_tx'] for summary in live),
+        'nic_rx': sum(summary['nic_rx'] for summary in live),
+        'tokens': sum(summary['tokens'] or 0 for summary in live),
+    }
+
+def addstr_clipped(win, y, x, text, attributes=curses.A_NORMAL):
+    """addstr() that silently drops anything outside the window."""
+    height, width = win.getmaxyx()
+    if 0 <= y < height and x < width:
+        try:
+            win.addstr(y, x, text[:width - x - 1] if y == height - 1 else text[:width - x], attributes)
+        except curses.error:
+            pass
+
+HOST_FORMAT = " {:<20} {:<6} {:>7} {:>5} {:>6} {:>9} {:>13} {:>13} {:>10}"
+
+def format_host_row(name, status, summary):
+    def number(value, fmt):
+        return fmt.format(value) if value is not None else "N/A"
+    return HOST_FORMAT.format(
+        name[:20], status, number(summary['cpu'], "{:.1f}%"), summary['gpus'],
+        number(summary['gpu_util'], "{:.0f}%"), f"{summary['gpu_memory']:.1f}Gi",
+        convert_bps(summary['nic_tx']), convert_bps(summary['nic_rx']), number(summary['tokens'], "{:.1f}"))
+
+async def aggregate(stdscr, args):
+    import asyncio
+    curses.curs_set(0)
+    stdscr.nodelay(1)
+    aggregator = Aggregator(stale_after=3 * args.interval)
+    host, port = parse_listen_address(args.aggregate)
+    server = await asyncio.start_server(aggregator.handle, host or None, port)
+    try:
+        while stdscr.getch() not in (ord('q'), ord('Q')):
+            rows = aggregator.rows()
+            totals = cluster_totals(rows)
+            stdscr.erase()
+            addstr_clipped(stdscr, 0, 0, f"AI Monitor cluster view: {totals['hosts']}/{len(rows)} hosts up "
+                                         f"(listening on {host or '0.0.0.0'}:{port}, q to quit)")
+            addstr_clipped(stdscr, 2, 0, HOST_FORMAT.format(
+                "Host", "Status", "CPU", "GPUs", "GPU", "GPU mem", "NIC tx", "NIC rx", "tokens/s"))
+            addstr_clipped(stdscr, 3, 0, format_host_row("Cluster total", "", dict(totals, cpu=None)))
+            height, _ = stdscr.getmaxyx()
+            for i, row in enumerate(rows[:max(height - 5, 0)]):
+                addstr_clipped(stdscr, 5 + i, 0, format_host_row(*row))
+            stdscr.refresh()
+            await asyncio.sleep(args.interval)
+    finally:
+        server.close()
+
+async def read_chunked(reader):
+    """Yield the chunks of an HTTP/1.1 chunked response body."""
+    while True:
+        size = int((await reader.readline()).split(b';')[0], 16)
+        if size == 0:
+            return
+        yield await reader.readexactly(size)
+        await reader.readline()
+
+async def read_until_eof(reader):
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            return
+        yield data
+
+async def stream_completion(url, payload):
+    """POST a streaming OpenAI-style completion request and return (ttft, latency, output tokens).
+
+    Uses a bare asyncio HTTP/1.1 connection so thousands of requests can be
+    in flight from one thread. Output tokens come from the final usage
+    chunk when the server sends one, otherwise every streamed text chunk
+    counts as one token.
+    """
+    import asyncio
+    parts = urlsplit(url)
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(
+        parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80), ssl=parts.scheme == 'https' or None)
+    try:
+        body = json.dumps(payload).encode()
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        writer.write(f"POST {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nContent-Type: application/json\r\n"
+                     f"Accept: text/event-stream\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                     + body)
+        status = (await reader.readline()).decode('latin-1').split()
+        if len(status) < 2 or status[1] != '200':
+            raise ConnectionError(f"HTTP {' '.join(status[1:]) or 'no response'}")
+        chunked = False
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if line.strip() == '':
+                break
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'transfer-encoding' and 'chunked' in value.lower():
+                chunked = True
+
+        ttft = usage = None
+        chunks = 0
+        buffer = b''
+        async for data in (read_chunked(reader) if chunked else read_until_eof(reader)):
+            buffer += data
+            *events, buffer = buffer.split(b'\n')
+            for event in events:
+                if not event.startswith(b'data:') or event[5:].strip() == b'[DONE]':
+                    continue
+                message = json.loads(event[5:])
+                if message.get('usage'):
+                    usage = message['usage'].get('completion_tokens')
+                for choice in message.get('choices') or []:
+                    if choice.get('text') or (choice.get('delta') or {}).get('content'):
+                        chunks += 1
+                        if ttft is None:
+                            ttft = time.perf_counter() - start
+        return ttft, time.perf_counter() - start, usage if usage is not None else chunks
+    finally:
+        writer.close()
+
+async def run_load_step(args, level, payload):
+    """Drive the endpoint at one concurrency (closed loop) or arrival rate (poisson) for --load-duration seconds.
+
+    Returns one record per finished request; requests still running at the
+    end of the step are cancelled and not counted.
+    """
+    import asyncio
+    import random
+    records = []
+    end = time.perf_counter() + args.load_duration
+
+    async def request():
+        try:
+            ttft, latency, tokens = await asyncio.wait_for(stream_completion(args.loadtest, payload), args.load_timeout)
+            records.append({'ttft': ttft, 'latency': latency, 'tokens': tokens, 'error': None})
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            records.append({'error': str(e) or type(e).__name__})
+
+    async def worker():
+        while time.perf_counter() < end:
+            await request()
+
+    if args.load_mode == 'closed':
+        tasks = [asyncio.create_task(worker()) for _ in range(int(level))]
+        await asyncio.wait(tasks, timeout=args.load_duration)
+    else:
+        tasks = []
+        while True:
+            await asyncio.sleep(random.expovariate(level))
+            if time.perf_counter() >= end:
+                break
+            tasks.append(asyncio.create_task(request()))
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return records
+
+def load_step_report(level, duration, records, summaries):
+    """Client-side throughput and latency of one step next to the averaged monitor summaries."""
+    finished = [record for record in records if record['error'] is None]
+    ttfts = sorted(record['ttft'] for record in finished if record['ttft'] is not None)
+    latencies = sorted(record['latency'] for record in finished)
+    report = {
+        'level': level,
+        'requests': len(finished),
+        'errors': len(records) - len(finished),
+        'requests_per_s': len(finished) / duration,
+        'tokens_per_s': sum(record['tokens'] for record in finished) / duration,
+        'ttft_p50': percentile(ttfts, 50),
+        'ttft_p99': percentile(ttfts, 99),
+        'latency_p50': percentile(latencies, 50),
+        'latency_p99': percentile(latencies, 99),
+    }
+    for field in ('cpu', 'gpu_util', 'gpu_memory', 'nic_tx', 'nic_rx', 'tokens'):
+        values = [summary[field] for summary in summaries if summary[field] is not None]
+        report[f"monitor_{field}"] = sum(values) / len(values) if values else None
+    return report
+
+LOAD_FORMAT = " {:>7} {:>8} {:>10} {:>15} {:>15} {:>6} {:>6} {:>9} {:>13} {:>13} {:>10}"
+
+def format_load_step(step):
+    def number(value, fmt="{:.1f}"):
+        return fmt.format(value) if value is not None else "N/A"
+
+    return LOAD_FORMAT.format(
+        number(step['level'], "{:g}"), number(step['requests_per_s'], "{:.2f}"), number(step['tokens_per_s']),
+        f"{format_seconds(step['ttft_p50'])}/{format_seconds(step['ttft_p99'])}",
+        f"{format_seconds(step['latency_p50'])}/{format_seconds(step['latency_p99'])}", step['errors'],
+        number(step['monitor_gpu_util'], "{:.0f}%"), number(step['monitor_gpu_memory'], "{:.1f}Gi"),
+        convert_bps(step['monitor_nic_tx'] or 0), convert_bps(step['monitor_nic_rx'] or 0),
+        number(step['monitor_tokens']))
+
+async def loadtest(args):
+    """Step the offered load against --loadtest while the collectors sample the node.
+
+    Prints one line per step and, with --load-report, writes the
+    throughput-vs-load curve as JSON.
+    """
+    if args.load_model:
+        model = args.load_model
+    else:
+        import urllib.request
+        models_url = args.loadtest.rsplit('/completions', 1)[0].rsplit('/chat', 1)[0] + '/models'
+        with urllib.request.urlopen(models_url, timeout=args.load_timeout) as response:
+            model = json.load(response)['data'][0]['id']
+    payload = {'model': model, 'prompt': args.load_prompt, 'max_tokens': args.load_max_tokens,
+               'stream': True, 'stream_options': {'include_usage': True}}
+
+    sampler = ProcSampler(args.root)
+    scheduler = Scheduler(build_collectors(args, sampler), args.interval, build_alerts(args))
+    summaries = []
+    stopped = threading.Event()
+
+    def monitor():
+        for snapshot in scheduler.run():
+            host = HostState('')
+            host.series = {key: value for key, value in snapshot_series(snapshot) if value is not None}
+            summaries.append((snapshot['time'], host.summary()))
+            if stopped.is_set():
+                return
+
+    thread = threading.Thread(target=monitor, name='load-monitor', daemon=True)
+    thread.start()
+    steps = []
+    print(f"Load test of {args.loadtest} ({model}), {args.load_mode} loop, {args.load_duration:g}s per step",
+          file=sys.stderr)
+    print(LOAD_FORMAT.format("clients" if args.load_mode == 'closed' else "offered", "req/s", "tokens/s",
+                             "TTFT p50/p99", "E2E p50/p99", "errors", "GPU", "GPU mem", "NIC tx", "NIC rx",
+                             "server t/s"))
+    try:
+        for level in args.load_steps:
+            start = time.time()
+            records = await run_load_step(args, level, payload)
+            step = load_step_report(level, args.load_duration, records,
+                                    [summary for timestamp, summary in summaries if timestamp >= start])
+            steps.append(step)
+            print(format_load_step(step), flush=True)
+    finally:
+        stopped.set()
+        thread.join(timeout=2 * args.interval)
+        scheduler.close()
+    if args.load_report:
+        with open(args.load_report, 'w') as f:
+            json.dump({'url': args.loadtest, 'model': model, 'mode': args.load_mode,
+                       'duration': args.load_duration, 'steps': steps}, f, indent=2)
+            f.write('\n')
+
+RESIZE_POLL = 0.1  # seconds; ncurses reports a resize on the next getch(), which nothing else wakes
+
+class LazyRows:
+    """A sequence of screen rows, (text, attributes), formatted only when accessed."""
+
+    def __init__(self, items, format_row):
+        self.items = items
+        self.format_row = format_row
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.format_row(self.items[index])
+
+class Screen:
+    """Curses renderer for a fixed header above scrollable, collapsible sections.
+
+    Sections are (key, title, rows) tuples where rows is any sequence of
+    (text, attributes), such as LazyRows. Only the rows that fit the
+    terminal are looked at and only screen lines that differ from the
+    previous frame are redrawn, so a frame costs the same for a 16-GPU,
+    40-NIC node as for a laptop. The last line is a status footer.
+    """
+
+    def __init__(self, stdscr):
+        self.stdscr = stdscr
+        self.top = 0
+        self.collapsed = set()
+        self.drawn = {}  # {screen line: (text, attributes)}
+        self.body_height = 0
+
+    def resize(self):
+        curses.update_lines_cols()
+        self.stdscr.clear()
+        self.drawn = {}
+
+    def scroll(self, key):
+        """Apply a scrolling key; return False if key does not scroll."""
+        page = max(self.body_height - 1, 1)
+        steps = {curses.KEY_UP: -1, ord('k'): -1, curses.KEY_DOWN: 1, ord('j'): 1,
+                 curses.KEY_PPAGE: -page, curses.KEY_NPAGE: page}
+        if key == curses.KEY_HOME:
+            self.top = 0
+        elif key == curses.KEY_END:
+            self.top = sys.maxsize  # clamped by draw()
+        elif key in steps:
+            self.top = max(self.top + steps[key], 0)
+        else:
+            return False
+        return True
+
+    def toggle(self, sections, number):
+        if 1 <= number <= len(sections):
+            self.collapsed ^= {sections[number - 1][0]}
+
+    def rows(self, sections, start, count):
+        """Yield count body rows starting at row start, skipping whole sections above it."""
+        position = 0
+        for number, (key, title, rows) in enumerate(sections, 1):
+            collapsed = key in self.collapsed
+            size = 1 + (0 if collapsed else len(rows))
+            if position + size <= start:
+                position += size
+                continue
+            for index in range(max(start - position, 0), size):
+                if count <= 0:
+                    return
+                if index == 0:
+                    hidden = f" ({len(rows)} rows hidden)" if collapsed else ""
+                    yield f"[{number}] {title}{hidden}", curses.A_BOLD
+                else:
+                    yield rows[index - 1]
+                count -= 1
+            position += size
+
+    def draw(self, header, sections, status=""):
+        height, width = self.stdscr.getmaxyx()
+        self.body_height = max(height - len(header) - 1, 0)
+        total = sum(1 + (0 if key in self.collapsed else len(rows)) for key, _, rows in sections)
+        self.top = max(min(self.top, total - self.body_height), 0)
+        lines = list(header[:height])
+        lines.extend(self.rows(sections, self.top, self.body_height))
+        if height > len(header):
+            lines.extend([("", curses.A_NORMAL)] * (height - 1 - len(lines)))
+            shown = f"{self.top + 1}-{min(self.top + self.body_height, total)}/{total}" if total else "0/0"
+            lines.append((f" rows {shown}  Up/Down/PgUp/PgDn scroll  1-9 fold  d debug  q quit  {status}",
+                          curses.A_REVERSE))
+        for y, line in enumerate(lines):
+            if self.drawn.get(y) != line:
+                self.stdscr.move(y, 0)
+                self.stdscr.clrtoeol()
+                addstr_clipped(self.stdscr, y, 0, *line)
+                self.drawn[y] = line
+        self.stdscr.noutrefresh()
+        curses.doupdate()
+
+def main(stdscr, args):
+    interval = args.interval
+    import select
     curses.curs_set(0)  # Hide the cursor
-    stdscr.nodelay(1)  # Make getch() non-blocking
-    stdscr.timeout(1000)  # Refresh every second
+    stdscr.nodelay(1)  # the loop below blocks in select() on stdin and the collection thread instead
 
-    hostname = socket.gethostname()
-    server_type = get_server_type()
-    cpu_sockets = get_cpu_sockets()
-    cpu_cores = get_cpu_cores()
-    cpu_type = get_cpu_type()
-    gpu_info = get_gpu_info()
-    num_gpus = len(gpu_info)
+    scheduler = recorder = replay = inventory = None
+    if args.replay:
+        replay = Replay(args.replay)
+        node_info = replay.meta
+        interval = replay.interval
+        snapshots = replay.run(args.speed, args.seek)
+    else:
+        sampler = ProcSampler(args.root)
+        inventory = Inventory(sampler, args.root, args.inventory_cache)
+        node_info = inventory.node_info()
+        scheduler = Scheduler(build_collectors(args, sampler), interval, build_alerts(args))
+        snapshots = scheduler.run()
+        if args.record:
+            recorder = Recorder(args.record, node_info, interval)
+    cpu_sockets = node_info['sockets']
 
     # Constants for column widths
     COMPONENT_WIDTH = 4 
@@ -140,62 +3754,329 @@ def main(stdscr, api_url):
     COMPONENT_FORMAT = f" {{:<{COMPONENT_WIDTH}}}  {{:<{UTILIZATION_WIDTH}}}  {{:<{MEMORY_WIDTH}}}"
     NIC_FORMAT = f" {{:<{COMPONENT_WIDTH}}} {{:<{MEMORY_WIDTH}}} {{:<{MEMORY_WIDTH}}}"
 
-    stdscr.addstr(0, 0, f"Cisco {server_type} computing node (hostname: {hostname})")
-    stdscr.addstr(2, 0, f"CPU: {cpu_sockets} x {cpu_type} with {cpu_cores} cores")
-    if num_gpus > 0:
-        stdscr.addstr(3, 0, f"GPU: {num_gpus} x {gpu_info[0][0]}")
-    else:
-        stdscr.addstr(3, 0, "No GPU detected")
+    ticks = SPARK_TICKS if locale.getpreferredencoding().upper() in ('UTF-8', 'UTF8') else ASCII_SPARK_TICKS
+    history = History(interval, ticks=ticks)
+    show_debug = False
+    gpus_seen = False
 
-    stdscr.addstr(5, 0, COMPONENT_FORMAT.format("", "Use", "Memory Use"))
+    # Snapshots are collected on their own thread; the renderer below only
+    # ever looks at the latest one and is woken through a pipe when it changes
+    lock = threading.Lock()
+    latest = {'snapshot': None, 'count': 0, 'done': False, 'error': None}
+    stop = threading.Event()
+    wake_read, wake_write = os.pipe()
+    os.set_blocking(wake_read, False)
+    os.set_blocking(wake_write, False)
 
-    interval = 1  # Adjust the interval as needed
+    def wake():
+        try:
+            os.write(wake_write, b'\0')
+        except OSError:
+            pass  # the pipe is full, the renderer has a wake-up pending anyway
+
+    def collect():
+        try:
+            for snapshot in snapshots:
+                if recorder:
+                    recorder.append(snapshot)
+                with lock:
+                    history.record(snapshot)
+                    latest['snapshot'] = snapshot
+                    latest['count'] += 1
+                wake()
+                if stop.is_set():
+                    break
+        except Exception as e:
+            latest['error'] = e
+        finally:
+            latest['done'] = True
+            wake()
+
+    def header_rows(snapshot):
+        nonlocal gpus_seen
+        gpus = (snapshot or {}).get('gpu') or []
+        if gpus:
+            gpu_line = f"GPU: {len(gpus)} x {gpus[0]['name']}"
+            if inventory and not gpus_seen:
+                inventory.update_gpus(gpus)
+            gpus_seen = True
+        elif not gpus_seen and inventory and inventory.facts['gpus']:
+            gpu_names = inventory.facts['gpus']
+            gpu_line = f"GPU: {len(gpu_names)} x {gpu_names[0]}"  # until the GPU backend reports
+        else:
+            gpu_line = "No GPU detected" if snapshot else ""
+        return [(line, curses.A_NORMAL) for line in (
+            f"Cisco {node_info['server']} computing node (hostname: {node_info['hostname']})",
+            "",
+            f"CPU: {cpu_sockets} x {node_info['cpu_model']} with {node_info['cores_per_socket']} cores",
+            gpu_line,
+            "",
+            COMPONENT_FORMAT.format("", "Use", "Memory Use"),
+        )]
 
+    def gpu_row(item):
+        if item is None:  # node power and energy per token after the GPUs
+            return format_efficiency(snapshot['efficiency']), curses.A_NORMAL
+        i, gpu = item
+        # With --sample-rate gpu=... the headline is the mean over the interval, not the last sample
+        gpu = dict(gpu, **{field: folded(snapshot, f"gpu{gpu['index']}.{field}", gpu[field])
+                           for field in ('utilization', 'memory_used', 'power')})
+        gpu_utilization = f"{gpu['utilization']:.0f}%" if gpu['utilization'] is not None else "N/A"
+        if gpu['memory_used'] is not None and gpu['memory_total'] is not None:
+            gpu_memory = f"{gpu['memory_used']:.1f}/{gpu['memory_total']:.1f}Gi"
+        else:
+            gpu_memory = "N/A"
+        return (COMPONENT_FORMAT.format(f"GPU{i+1}", gpu_utilization, gpu_memory)
+                + f"{format_gpu_power(gpu):<28}  "
+                + format_trend(history, f"gpu{gpu['index']}.utilization", "{:.0f}")
+                + format_fold(snapshot, f"gpu{gpu['index']}.utilization", "{:.0f}")), curses.A_NORMAL
+
+    def nic_row(item):
+        nic_index, (name, (sent_bps, recv_bps)) = item
+        sent_bps, recv_bps = folded(snapshot, f"nic.{name}.tx", sent_bps), folded(snapshot, f"nic.{name}.rx", recv_bps)
+        nic_memory = f"tx: {convert_bps(sent_bps)}, rx: {convert_bps(recv_bps)}"
+        peaks = (snapshot.get('fold') or {}).get(f"nic.{name}.tx")
+        if peaks:
+            nic_memory += f" (peak tx: {convert_bps(peaks['max'])}"
+            nic_memory += f", rx: {convert_bps(snapshot['fold'][f'nic.{name}.rx']['max'])})"
+        return NIC_FORMAT.format(f"NIC{nic_index}", nic_memory, f"({name})"), curses.A_NORMAL
+
+    def sections(snapshot):
+        """Build the screen sections of a snapshot; GPU and NIC rows are formatted lazily."""
+        def plain(lines):
+            return [(line, curses.A_NORMAL) for line in lines]
+
+        cpu = snapshot['cpu'] or {'average': None, 'sockets': {}}
+        average = folded(snapshot, 'cpu', cpu['average'])
+        cpu_average = f"{average:.2f}%" if average is not None else "N/A"
+        memory = snapshot['memory']
+        memory_used = folded(snapshot, 'memory.used', memory['used']) if memory else None
+        memory_use = f"{format_bytes(memory_used)}/{format_bytes(memory['total'])}" if memory else "N/A"
+        cpu_rows = [(COMPONENT_FORMAT.format("CPU", cpu_average, memory_use) + format_trend(history, 'cpu')
+                     + format_fold(snapshot, 'cpu') + format_fold(snapshot, 'memory.used', format_bytes, "mem "),
+                     curses.A_NORMAL)]
+        if cpu_sockets > 1:
+            cpu_rows += plain(COMPONENT_FORMAT.format(
+                f"S{socket_id}", f"{folded(snapshot, f'cpu.socket{socket_id}', socket_usage):.2f}%", "")
+                for socket_id, socket_usage in cpu['sockets'].items())
+        if len(snapshot.get('numa') or {}) > 1:  # NUMA nodes with their GPUs and NICs on multi-node hosts
+            cpu_rows += plain(format_numa(snapshot))
+            cpu_rows += [(f" NUMA: {line}", curses.A_REVERSE) for line in placement_warnings(snapshot)]
+        result = [('cpu', "CPU", cpu_rows)]
+
+        gpus = snapshot['gpu'] or []  # GPUs may appear or disappear between ticks
+        result.append(('gpu', f"GPU ({len(gpus)})",
+                       LazyRows(list(enumerate(gpus)) + ([None] if snapshot.get('efficiency') else []), gpu_row)))
+        nics = snapshot['nic'] or {}
+        result.append(('nic', f"NIC ({len(nics)})", LazyRows(list(enumerate(nics.items(), 1)), nic_row)))
+
+        if snapshot.get('process'):  # the processes holding GPU memory if --processes is given
+            result.append(('process', "Processes", plain([f" {'':<5} {'PID':>7} {'GPU mem':>8}  Process"]
+                                                         + format_processes(snapshot['process']))))
+        if snapshot.get('cgroup'):  # the busiest containers and slices if --cgroups is given or replayed
+            header = f" {'Cgroup':<34} {'CPU':>10} {'Thr':>5}  {'Memory':<15} {'IO r/w':<17} Net tx/rx"
+            result.append(('cgroup', "Cgroups", plain([header] + format_cgroups(snapshot['cgroup'], args.cgroups or REPLAY_CGROUPS))))
+
+        if snapshot.get('vllm') is not None:  # vLLM metrics if api_url is specified
+            vllm_rows = plain(format_vllm(snapshot['vllm']))
+            vllm_rows += plain(["      tokens/s " + format_trend(history, 'vllm.throughput')])
+            if 'vllm.ttft_p99' in history.series:
+                vllm_rows += plain(["  TTFT p99 (s) " + format_trend(history, 'vllm.ttft_p99', "{:.2f}")])
+            vllm_rows += [(line, curses.A_REVERSE) for line in format_slo(snapshot['vllm'])]
+            result.append(('vllm', "LLM", vllm_rows))
+
+        # Firing alerts highlighted and pending ones plain
+        alerts = [alert for alert in snapshot.get('alerts') or [] if alert['state'] != 'inactive']
+        if alerts:
+            result.append(('alerts', f"Alerts ({len(alerts)})", [
+                (format_alert(alert), curses.A_REVERSE | curses.A_BOLD if alert['state'] == 'firing' else curses.A_NORMAL)
+                for alert in alerts]))
+
+        # The monitor's own overhead, toggled with the d key
+        if show_debug and snapshot.get('self'):
+            result.append(('debug', "Monitor", plain(format_self_stats(snapshot['self']))))
+        return result
+
+    screen = Screen(stdscr)
+    collector = threading.Thread(target=collect, name='collect', daemon=True)
+    collector.start()
+    drawn_state = None
+    snapshot = None
     try:
+        screen.draw(header_rows(None), [])
         while True:
-            args = poll(interval)
-            network_stats = refresh_window(interval, *args)
-            cpu_average = float(get_cpu_average())
-            total_memory, used_memory, available_memory = get_memory_info()
-
-            # Print CPU metrics
-            stdscr.addstr(7, 0, COMPONENT_FORMAT.format("CPU", f"{cpu_average:.2f}%", f"{used_memory}/{total_memory}"))
-
-            # Print GPU metrics
-            row_offset = 9 
-            for i, (gpu_name, memory_used, gpu_utilization, gpu_memory) in enumerate(get_gpu_info()):
-                stdscr.addstr(row_offset + i, 0, COMPONENT_FORMAT.format(f"GPU{i+1}", f"{gpu_utilization}%", f"{memory_used:.1f}/{gpu_memory:.1f}Gi"))
-
-            # Print NIC metrics
-            row_offset += num_gpus + 1
-            nic_index = 1
-            for name, (sent_speed_human, recv_speed_human) in network_stats.items():
-                if any(addr.address for addr in psutil.net_if_addrs().get(name, []) if addr.family == socket.AF_INET):
-                    nic_memory = f"tx: {sent_speed_human}, rx: {recv_speed_human}"
-                    stdscr.addstr(row_offset, 0, NIC_FORMAT.format(f"NIC{nic_index}", nic_memory, f"({name})"))
-                    row_offset += 1
-                    nic_index += 1
-
-            # Print Avg Generation Throughput if api_url is specified
-            if api_url:  # Check if api_url is specified
-                generation_throughput = get_generation_throughput(api_url)
-                stdscr.addstr(row_offset + 1, 0, f" LLM: {generation_throughput:.2f} tokens/s [API up]" if isinstance(generation_throughput, float) else f" LLM: {generation_throughput}")
-                row_offset += 1
-
-            stdscr.clrtoeol()  # Clear to end of line to handle overwriting
-            stdscr.refresh()
-            time.sleep(interval)
+            key = stdscr.getch()
+            if key == -1 and latest['error'] is None and (latest['count'], latest['done']) == drawn_state:
+                # Nothing to draw: sleep until a key, a new snapshot or the resize poll
+                select.select([sys.stdin, wake_read], [], [], RESIZE_POLL)
+                try:
+                    os.read(wake_read, 4096)
+                except BlockingIOError:
+                    pass
+                continue
+            if key in (ord('q'), ord('Q')):
+                break
+            elif key == curses.KEY_RESIZE:
+                screen.resize()
+            elif key in (ord('d'), ord('D')):
+                show_debug = not show_debug
+            elif ord('1') <= key <= ord('9') and snapshot is not None:
+                screen.toggle(sections(snapshot), key - ord('0'))
+            elif not screen.scroll(key) and key != -1:
+                continue
+            if latest['error'] is not None:
+                raise latest['error']
+
+            render_start = time.perf_counter()
+            with lock:
+                snapshot, drawn_state = latest['snapshot'], (latest['count'], latest['done'])
+                if snapshot is None:
+                    screen.draw(header_rows(None), [])
+                    continue
+                status = "end of recording" if latest['done'] and replay else ""
+                if recorder and recorder.warning:
+                    status = recorder.warning
+                screen.draw(header_rows(snapshot), sections(snapshot), status)
+            if scheduler:
+                scheduler.stats.record('render', time.perf_counter() - render_start)
+                if 'startup' not in scheduler.stats.latency:
+                    scheduler.stats.record('startup', time.perf_counter() - START_TIME)
 
     except KeyboardInterrupt:
         stdscr.clear()  # Clear the screen before exiting
         stdscr.addstr(0, 0, "Exiting gracefully...\n")
         stdscr.refresh()
         time.sleep(2)
+    finally:
+        stop.set()
+        if recorder:
+            collector.join(timeout=2 * interval)  # let the last append finish before closing the log
+        if scheduler:
+            scheduler.close()
+        if recorder:
+            recorder.close()
+        if replay:
+            replay.close()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="AI Network and GPU Monitoring Tool")
-    parser.add_argument('--api-url', type=str, default=None,
-                        help='The API URL to retrieve generation throughput from')
+    parser.add_argument('--api-url', type=str, action='append', default=[],
+                        help='A vLLM /metrics URL to retrieve generation throughput from (repeatable)')
+    parser.add_argument('--api-targets', type=str, default=None, metavar='FILE',
+                        help='File listing more vLLM /metrics URLs, one per line')
+    parser.add_argument('--api-timeout', type=float, default=1.0, metavar='SECONDS',
+                        help='Read timeout for each vLLM endpoint (default: 1)')
+    parser.add_argument('--latency-window', type=float, default=60, metavar='SECONDS',
+                        help='Window for the vLLM latency quantiles (default: 60)')
+    parser.add_argument('--slo', type=parse_slo, action='append', default=[], metavar='METRIC:QUANTILE=SECONDS',
+                        help='Flag a vLLM latency SLO violation, e.g. ttft:p99=0.5 (repeatable)')
+    parser.add_argument('--alert', type=parse_alert, action='append', default=[], metavar='RULE',
+                        help='Alert rule "NAME: [FUNCTION(]SERIES[, SECONDS)] OP NUMBER [clear NUMBER] [and ...]'
+                             ' [for SECONDS]" (repeatable)')
+    parser.add_argument('--alert-rules', type=str, default=None, metavar='FILE',
+                        help='File with more alert rules, one per line')
+    parser.add_argument('--alert-sink', type=parse_alert_sink, action='append', default=[], metavar='SINK',
+                        help='Deliver alert events to log:FILE, exec:COMMAND or an http:// webhook (repeatable)')
+    parser.add_argument('--interval', type=float, default=1,
+                        help='Refresh interval in seconds (default: 1)')
+    parser.add_argument('--root', type=str, default='/',
+                        help='Filesystem root to read /proc and /sys from (default: /)')
+    parser.add_argument('--inventory-cache', type=str, default=default_inventory_path(), metavar='FILE',
+                        help='Where to cache static host facts between runs (default: %(default)s)')
+    parser.add_argument('--no-inventory-cache', dest='inventory_cache', action='store_const', const=None,
+                        help='Always read static host facts from scratch')
+    parser.add_argument('--gpu-backend', choices=['nvidia-smi', 'nvml'], default='nvidia-smi',
+                        help='How to read GPU statistics (default: nvidia-smi)')
+    parser.add_argument('--smoothing', choices=['none', 'ewma', 'window'], default='ewma',
+                        help='How to smooth tokens/s and other counter rates (default: ewma)')
+    parser.add_argument('--smoothing-window', type=float, default=5,
+                        help='Smoothing time constant or window in seconds (default: 5)')
+    parser.add_argument('--processes', type=int, default=0, metavar='N',
+                        help='Show the N processes holding the most memory on each GPU, grouped by vLLM server')
+    parser.add_argument('--cgroups', type=int, default=0, metavar='N',
+                        help='Show the N containers and slices using the most CPU, from cgroup v2')
+    parser.add_argument('--nic-include', action='append', default=[], metavar='GLOB',
+                        help='Only show NICs matching GLOB (repeatable, e.g. "eth*")')
+    parser.add_argument('--nic-exclude', action='append', default=[], metavar='GLOB',
+                        help='Hide NICs matching GLOB (repeatable, lo and docker0 are always hidden)')
+    parser.add_argument('--sample-rate', type=parse_sample_rate, action='append', default=[],
+                        metavar='NAME=SECONDS',
+                        help='Sample cpu, memory, gpu or nic every SECONDS and show min/p99/max per refresh (repeatable)')
+    parser.add_argument('--burst', type=float, default=None, metavar='SECONDS',
+                        help='Print every raw sample of the --sample-rate collectors as JSON lines for SECONDS and exit')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default=None,
+                        help='Run without curses and write one record per refresh in this format')
+    parser.add_argument('--output', type=str, default=None, metavar='FILE',
+                        help='Append --format records to FILE instead of stdout')
+    parser.add_argument('--count', type=int, default=None, metavar='N',
+                        help='Exit after writing N records')
+    parser.add_argument('--once', action='store_true',
+                        help='Write a single record and exit, same as --count 1')
+    parser.add_argument('--flush-interval', type=float, default=5, metavar='SECONDS',
+                        help='Write buffered --format records at most this often (default: 5)')
+    parser.add_argument('--serve', type=str, default=None, metavar='[HOST]:PORT',
+                        help='Run without curses and serve Prometheus metrics on HOST:PORT')
+    parser.add_argument('--agent', type=str, default=None, metavar='HOST:PORT',
+                        help='Run without curses and stream samples to an aggregator at HOST:PORT')
+    parser.add_argument('--name', type=str, default=None,
+                        help='Host name reported in agent mode (default: hostname)')
+    parser.add_argument('--aggregate', type=str, default=None, metavar='[HOST]:PORT',
+                        help='Show one row per host for agents connecting to HOST:PORT')
+    parser.add_argument('--loadtest', type=str, default=None, metavar='URL',
+                        help='Drive an OpenAI-compatible /v1/completions URL with stepped load and report the curve')
+    parser.add_argument('--load-mode', choices=['closed', 'poisson'], default='closed',
+                        help='closed: steps are concurrent clients, poisson: steps are arrival rates in req/s')
+    parser.add_argument('--load-steps', type=lambda text: [float(value) for value in text.split(',')],
+                        default=[1, 2, 4, 8, 16], metavar='N,N,...',
+                        help='Concurrency or request rate of each step (default: 1,2,4,8,16)')
+    parser.add_argument('--load-duration', type=float, default=30, metavar='SECONDS',
+                        help='Duration of each load step (default: 30)')
+    parser.add_argument('--load-model', type=str, default=None,
+                        help='Model to request (default: the first one listed by /v1/models)')
+    parser.add_argument('--load-prompt', type=str, default='Write a short story about a GPU.',
+                        help='Prompt sent with every request')
+    parser.add_argument('--load-max-tokens', type=int, default=128,
+                        help='max_tokens of every request (default: 128)')
+    parser.add_argument('--load-timeout', type=float, default=60, metavar='SECONDS',
+                        help='Give up on a request after this long (default: 60)')
+    parser.add_argument('--load-report', type=str, default=None, metavar='FILE',
+                        help='Write the load test results as JSON')
+    parser.add_argument('--record', type=str, default=None, metavar='FILE',
+                        help='Append every refresh to a binary session log')
+    parser.add_argument('--replay', type=str, default=None, metavar='FILE',
+                        help='Replay a session log recorded with --record')
+    parser.add_argument('--speed', type=float, default=1,
+                        help='Replay speed multiplier (default: 1)')
+    parser.add_argument('--seek', type=float, default=0,
+                        help='Start the replay this many seconds into the recording, negative counts from the end')
     args = parser.parse_args()
 
-    curses.wrapper(lambda stdscr: main(stdscr, args.api_url))  # Pass the api_url to the main function
\ No newline at end of file
+    if args.loadtest:
+        import asyncio
+        try:
+            asyncio.run(loadtest(args))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    if args.burst:
+        burst(args)
+        sys.exit(0)
+    if args.format:
+        write_output(args)
+        sys.exit(0)
+    if args.serve:
+        serve(args)
+        sys.exit(0)
+    if args.agent:
+        agent(args)
+        sys.exit(0)
+    if args.aggregate:
+        import asyncio
+        try:
+            curses.wrapper(lambda stdscr: asyncio.run(aggregate(stdscr, args)))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    locale.setlocale(locale.LC_ALL, '')  # let curses draw the unicode sparklines
+    curses.wrapper(lambda stdscr: main(stdscr, args))  # Pass the parsed arguments to the main function
\ No newline at end of file
@@ -4,6 +4,8 @@
 import subprocess
 import time
 import sys
+import os
+import importlib.util
 import psutil
 import curses
 import socket
@@ -25,19 +27,16 @@ def get_total_generated_tokens(api_url):
     except requests.RequestException:
         return None
 
-def measure_tokens_per_second(api_url, interval=10):
-    """Manually measure tokens per second."""
-    tokens_before = get_total_generated_tokens(api_url)
-    if tokens_before is None:
-        return "N/A [API Down]"
+HERE = os.path.dirname(os.path.abspath(__file__))
 
-    time.sleep(interval)
-    tokens_after = get_total_generated_tokens(api_url)
-
-    if tokens_after is None:
-        return "N/A [Metric not found]"
+def load_monitor():
+    """Import ai-monitor-plus.py, whose name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location('ai_monitor_plus', os.path.join(HERE, 'ai-monitor-plus.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
 
-    return (tokens_after - tokens_before) / interval
+RateEngine = load_monitor().RateEngine  # the same counter-rate logic as ai-monitor-plus.py
 
 def convert_bps(bits_per_second):
     """Convert bits per second to Mbps or Gbps based on magnitude."""
@@ -129,24 +128,7 @@ def get_memory_info():
     total, used, available = result.split()
     return total, used, available
 
-def get_generation_throughput(api_url):
-    """Retrieve the average generation throughput from the vLLM API."""
-    try:
-        response = requests.get(api_url)
-        response.raise_for_status()  # Raise an error for bad status codes
-
-        # Extract the specific metric from the Prometheus text response
-        pattern = r'^vllm:avg_generation_throughput_toks_per_s{.*}\s+([\d\.]+)'
-        match = re.search(pattern, response.text, re.MULTILINE)
-        if match:
-            return float(match.group(1))
-        else:
-            return "N/A [API down]"  # Return "N/A" if metric not found
-
-    except requests.RequestException:
-        return "N/A [API down]"  # Suppress error messages and return "N/A" if the API is down
-
-def main(stdscr, api_url):
+def main(stdscr, api_url, smoothing='ewma', smoothing_window=5):
     curses.curs_set(0)  # Hide the cursor
     stdscr.nodelay(1)  # Make getch() non-blocking
     stdscr.timeout(1000)  # Refresh every second
@@ -178,6 +160,7 @@ def main(stdscr, api_url):
     stdscr.addstr(5, 0, COMPONENT_FORMAT.format("", "Use", "Memory Use"))
 
     interval = 1  # Adjust the interval as needed
+    rates = RateEngine(smoothing, smoothing_window)
 
     try:
         while True:
@@ -209,7 +192,15 @@ def main(stdscr, api_url):
 # ... (rest of your function remains unchanged)
 
             if api_url:  # Only modify vLLM metric handling
-                tokens_per_second = measure_tokens_per_second(api_url, interval)
+                # One scrape per refresh, the rate comes from the previous refresh's sample
+                tokens = get_total_generated_tokens(api_url)
+                if tokens is None:
+                    rates.forget(())
+                    tokens_per_second = "N/A [API Down]"
+                else:
+                    tokens_per_second = rates.update('generation_tokens', tokens)
+                    if tokens_per_second is None:
+                        tokens_per_second = "N/A [Measuring]"
                 stdscr.addstr(row_offset + 1, 0, f" LLM: {tokens_per_second:.2f} tokens/s [API up]" if isinstance(tokens_per_second, float) else f" LLM: {tokens_per_second}")
 
     # ... (rest of your function remains unchanged)
@@ -229,6 +220,10 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="AI Network and GPU Monitoring Tool")
     parser.add_argument('--api-url', type=str, default=None,
                         help='The API URL to retrieve generation throughput from')
+    parser.add_argument('--smoothing', choices=['none', 'ewma', 'window'], default='ewma',
+                        help='How to smooth tokens/s (default: ewma)')
+    parser.add_argument('--smoothing-window', type=float, default=5,
+                        help='Smoothing time constant or window in seconds (default: 5)')
     args = parser.parse_args()
 
-    curses.wrapper(lambda stdscr: main(stdscr, args.api_url))  # Pass the api_url to the main function
+    curses.wrapper(lambda stdscr: main(stdscr, args.api_url, args.smoothing, args.smoothing_window))